@@ -0,0 +1,193 @@
+import os
+import json
+import shutil
+import zipfile
+import tempfile
+from multiprocessing.pool import ThreadPool
+
+from redash_client.constants import RefreshMode, VizWidth
+from redash_client.results import write_json
+from redash_client.utils import get_widget_query, map_concurrently
+
+DASHBOARD_ENTRY = "dashboard.json"
+QUERY_ENTRY = "queries/{0}.json"
+RESULT_ENTRY = "results/{0}.json"
+# Where the rows are in a query result.
+RESULT_ROWS_PATH = ("data", "rows")
+
+# Visualizations Redash creates by itself along with every new query.
+DEFAULT_VISUALIZATION_TYPE = "TABLE"
+
+
+def _get_widget_query_id(widget):
+  query = get_widget_query(widget)
+  return query["id"] if query is not None else None
+
+
+class DashboardArchiver(object):
+  # Backs up a dashboard to a zip archive and restores it, possibly on
+  # another Redash server. The archive holds the dashboard and its widgets
+  # (dashboard.json), each widget's query with all its visualizations
+  # (queries/<id>.json) and optionally each query's latest result
+  # (results/<id>.json). Results are kept for reference only: a restored
+  # query is refreshed on the server instead.
+
+  def __init__(self, client, max_workers=8):
+    self._client = client
+    self._max_workers = max_workers
+
+  def _get_pool(self, item_count):
+    return ThreadPool(max(1, min(self._max_workers, item_count)))
+
+  def _fetch_query(self, fetch_args):
+    # Returns the query and the path of a file holding its result's JSON,
+    # if the result is to be archived. The rows are written one at a time,
+    # so a result spilled to disk isn't loaded back into memory.
+    query_id, result_dir = fetch_args
+    query = self._client.get_query(query_id)
+
+    result_path = None
+    result_id = query.get("latest_query_data_id", None)
+    if result_dir and result_id:
+      result = self._client.get_query_result(result_id)
+      rows = result.get("data", {}).get("rows", None)
+      try:
+        result_path = os.path.join(result_dir, "{0}.json".format(query_id))
+        with open(result_path, "w") as result_file:
+          write_json(result, result_file, RESULT_ROWS_PATH)
+      finally:
+        if hasattr(rows, "close"):
+          rows.close()
+
+    return query_id, query, result_path
+
+  def export(self, name, path, include_results=False):
+    # Returns the number of queries archived. Each query is written to the
+    # archive as soon as it has been fetched.
+    dashboard = self._client.get_dashboard(self._client.get_slug(name))
+
+    widgets = dashboard.get("widgets", [])
+    query_ids = []
+    for widget in widgets:
+      query_id = _get_widget_query_id(widget)
+      if query_id is not None and query_id not in query_ids:
+        query_ids.append(query_id)
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+      archive.writestr(DASHBOARD_ENTRY, json.dumps({
+          "name": dashboard.get("name", name),
+          "is_draft": dashboard.get("is_draft", False),
+          "widgets": [{
+              "width": widget.get("width", VizWidth.REGULAR),
+              "options": widget.get("options", {}),
+              "text": widget.get("text", ""),
+              "query_id": _get_widget_query_id(widget),
+              "visualization_id": (
+                  widget.get("visualization", None) or {}).get("id", None),
+          } for widget in widgets],
+      }))
+
+      result_dir = tempfile.mkdtemp() if include_results else None
+      pool = self._get_pool(len(query_ids))
+      try:
+        fetch_args = [(query_id, result_dir) for query_id in query_ids]
+        fetched_queries = pool.imap_unordered(self._fetch_query, fetch_args)
+        for query_id, query, result_path in fetched_queries:
+          archive.writestr(QUERY_ENTRY.format(query_id), json.dumps(query))
+          if result_path is not None:
+            archive.write(result_path, RESULT_ENTRY.format(query_id))
+            os.remove(result_path)
+      finally:
+        pool.terminate()
+        if result_dir:
+          shutil.rmtree(result_dir, ignore_errors=True)
+
+    return len(query_ids)
+
+  def _restore_query(self, query):
+    client = self._client
+    query_id, table_id = client.create_new_query(
+        query["name"], query["query"], query["data_source_id"],
+        query.get("description", None), refresh=RefreshMode.DEFERRED)
+    if query.get("options", None):
+      client.update_query(
+          query_id, query["name"], query["query"], query["data_source_id"],
+          query.get("description", None), query["options"],
+          refresh=RefreshMode.DEFERRED)
+
+    return query_id, table_id
+
+  def _restore_visualization(self, restore_args):
+    query_id, visualization = restore_args
+    new_visualization_id = self._client.make_new_visualization_request(
+        query_id, visualization["type"], visualization.get("options", {}),
+        visualization.get("name", ""))
+    return visualization["id"], new_visualization_id
+
+  def _restore_widget(self, restore_args):
+    dash_id, widget, visualization_id = restore_args
+    return self._client.add_visualization_to_dashboard(
+        dash_id, visualization_id, widget["width"], widget["options"],
+        widget["text"])
+
+  def restore(self, path, name=None):
+    # Recreates the archived dashboard under name (default: its archived
+    # name) with new copies of its queries and visualizations. Each step
+    # runs concurrently: queries, then visualizations, then widgets.
+    # Returns the new dashboard's info, as create_new_dashboard() does.
+    with zipfile.ZipFile(path) as archive:
+      dashboard = json.loads(archive.read(DASHBOARD_ENTRY).decode("utf-8"))
+      queries = [
+          json.loads(archive.read(entry).decode("utf-8"))
+          for entry in archive.namelist() if entry.startswith("queries/")
+      ]
+
+    name = name or dashboard["name"]
+    client = self._client
+    try:
+      existing = client.get_dashboard(client.get_slug(name))
+    except client.RedashClientException as e:
+      if e.args[1] != 404:
+        raise
+      existing = {}
+    if existing.get("widgets", None):
+      raise client.RedashClientException(
+          "Dashboard {0} already exists and has widgets".format(name))
+
+    # The dashboard doesn't depend on the queries, so create it alongside.
+    pool = self._get_pool(len(queries) + 1)
+    try:
+      pending_dashboard = pool.apply_async(
+          client.create_new_dashboard, (name,))
+      restored_queries = pool.map(self._restore_query, queries)
+      dash_info = pending_dashboard.get()
+    finally:
+      pool.terminate()
+
+    visualization_ids = {}
+    visualizations_to_restore = []
+    for query, (new_id, table_id) in zip(queries, restored_queries):
+      default_table_used = False
+      for visualization in query.get("visualizations", []):
+        if (visualization["type"] == DEFAULT_VISUALIZATION_TYPE and
+           table_id and not default_table_used):
+          visualization_ids[visualization["id"]] = table_id
+          default_table_used = True
+        else:
+          visualizations_to_restore.append((new_id, visualization))
+
+    visualization_ids.update(map_concurrently(
+        self._restore_visualization, visualizations_to_restore,
+        self._max_workers))
+
+    widget_args = [
+        (dash_info["dashboard_id"], widget,
+         visualization_ids.get(widget["visualization_id"], None))
+        for widget in dashboard["widgets"]
+    ]
+    map_concurrently(self._restore_widget, widget_args, self._max_workers)
+
+    if not dashboard.get("is_draft", False):
+      client.publish_dashboard(dash_info["dashboard_id"])
+    client.flush_refreshes()
+    return dash_info
@@ -0,0 +1,150 @@
+import datetime
+
+from redash_client.utils import (
+    get_all_pages, get_widget_query, map_concurrently)
+
+REDASH_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def parse_redash_time(timestamp):
+  # Redash timestamps are UTC, e.g. "2017-05-04T18:42:13.165631+00:00".
+  # Fractional seconds and the offset are dropped.
+  return datetime.datetime.strptime(timestamp[:19], REDASH_TIME_FORMAT)
+
+
+class CleanupPlan(object):
+  # What a GarbageCollector would delete: queries as returned by the query
+  # list, and the widgets showing them as
+  # {"id": ..., "dashboard": <slug>, "query_id": ...}.
+
+  def __init__(self, queries, widgets):
+    self.queries = queries
+    self.widgets = widgets
+
+  def __len__(self):
+    return len(self.queries) + len(self.widgets)
+
+  def describe(self):
+    lines = [
+        ("Delete widget {id} on dashboard {dashboard} "
+         "(query {query_id})").format(**widget)
+        for widget in self.widgets
+    ]
+    lines.extend(
+        u"Delete query {0}: {1}".format(query["id"], query.get("name", ""))
+        for query in self.queries)
+    lines.append("{0} widgets and {1} queries".format(
+        len(self.widgets), len(self.queries)))
+    return "\n".join(lines)
+
+
+class CleanupResult(object):
+
+  def __init__(self):
+    self.deleted_queries = []
+    self.deleted_widgets = []
+    # (kind, id, error message) for every item that couldn't be deleted
+    self.errors = []
+
+
+class GarbageCollector(object):
+  # Finds queries left behind by experiment tooling and deletes them
+  # together with the widgets that show them. plan() only reads, so its
+  # CleanupPlan can be reviewed (plan.describe()) before execute() runs it.
+  PAGE_SIZE = 250
+
+  def __init__(self, client, max_workers=8):
+    self._client = client
+    self._max_workers = max_workers
+
+  def _get_dashboard_widgets(self, dashboard):
+    widgets = []
+    json_dashboard = self._client.get_dashboard(dashboard["slug"])
+    for widget in json_dashboard.get("widgets", []):
+      query = get_widget_query(widget)
+      if query is not None:
+        widgets.append({
+            "id": widget["id"],
+            "dashboard": dashboard["slug"],
+            "query_id": query["id"],
+        })
+    return widgets
+
+  def _matches(self, query, name_prefix, tags, updated_before):
+    if name_prefix and not (query.get("name") or "").startswith(name_prefix):
+      return False
+    if tags and not set(tags) & set(query.get("tags") or []):
+      return False
+    if updated_before:
+      updated_at = query.get("updated_at", None)
+      if not updated_at or parse_redash_time(updated_at) >= updated_before:
+        return False
+    return True
+
+  def plan(self, name_prefix=None, tags=None, older_than=None,
+           unused_only=False):
+    # Note: a query is a candidate when it matches all of the criteria
+    # given: its name starts with name_prefix, it has any of tags, it was
+    # last updated more than older_than (a datetime.timedelta) ago, and with
+    # unused_only, no dashboard shows it.
+    if not (name_prefix or tags or older_than or unused_only):
+      raise ValueError("At least one cleanup criterion is required")
+
+    updated_before = None
+    if older_than:
+      updated_before = datetime.datetime.utcnow() - older_than
+
+    queries = [
+        query for query in get_all_pages(
+            self._client.get_queries, self.PAGE_SIZE)
+        if self._matches(query, name_prefix, tags, updated_before)
+    ]
+
+    dashboards = list(get_all_pages(
+        self._client.get_dashboards, self.PAGE_SIZE))
+    dashboard_widgets = map_concurrently(
+        self._get_dashboard_widgets, dashboards, self._max_workers)
+    widgets = [
+        widget for widgets in dashboard_widgets for widget in widgets]
+
+    used_query_ids = set(widget["query_id"] for widget in widgets)
+    if unused_only:
+      queries = [
+          query for query in queries if query["id"] not in used_query_ids]
+
+    query_ids = set(query["id"] for query in queries)
+    widgets = [widget for widget in widgets if widget["query_id"] in query_ids]
+    return CleanupPlan(queries, widgets)
+
+  def _delete(self, delete_args):
+    delete_function, item_id = delete_args
+    try:
+      delete_function(item_id)
+      return None
+    except self._client.RedashClientException as e:
+      return e.args[0]
+
+  def execute(self, plan):
+    # Widgets go first so no dashboard is left showing a deleted query.
+    # Failures don't stop the cleanup; they are listed in result.errors.
+    result = CleanupResult()
+    steps = (
+        ("widget", plan.widgets, self._client.remove_visualization,
+         result.deleted_widgets),
+        ("query", plan.queries, self._client.delete_query,
+         result.deleted_queries),
+    )
+
+    for kind, items, delete_function, deleted in steps:
+      item_ids = [item["id"] for item in items]
+      errors = map_concurrently(
+          self._delete, [(delete_function, item_id) for item_id in item_ids],
+          self._max_workers)
+
+      for item_id, error in zip(item_ids, errors):
+        if error is None:
+          deleted.append(item_id)
+        else:
+          result.errors.append((kind, item_id, error))
+
+    return result
@@ -0,0 +1,227 @@
+import io
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import argparse
+from multiprocessing.pool import ThreadPool
+
+from redash_client.client import RedashClient
+
+OUTPUT_FORMATS = ("ndjson", "csv")
+
+
+def get_sql_paths(patterns):
+  # Patterns are expanded here as well as by the shell, so quoted globs
+  # (and "**" on shells without globstar) work too.
+  paths = []
+  for pattern in patterns:
+    matches = sorted(glob.glob(pattern)) or [pattern]
+    for path in matches:
+      if os.path.isdir(path):
+        path_matches = sorted(glob.glob(os.path.join(path, "*.sql")))
+      else:
+        path_matches = [path]
+      paths.extend(match for match in path_matches if match not in paths)
+  return paths
+
+
+def _split_path(path):
+  parts = []
+  while True:
+    head, tail = os.path.split(path)
+    if not tail:
+      return [head] + parts[::-1] if head else parts[::-1]
+    parts.append(tail)
+    path = head
+
+
+def get_output_names(sql_paths):
+  # Names each result after its .sql file's path below the directory all
+  # the files share, without the extension: "a/q.sql" and "b/q.sql" become
+  # "a/q" and "b/q", while files from one directory keep their bare names.
+  split_dirs = [
+      _split_path(os.path.dirname(os.path.abspath(path)))
+      for path in sql_paths]
+  common_length = 0
+  if split_dirs:
+    for parts in zip(*split_dirs):
+      if any(part != parts[0] for part in parts):
+        break
+      common_length += 1
+
+  output_names = {}
+  for path, dir_parts in zip(sql_paths, split_dirs):
+    name = os.path.splitext(os.path.basename(path))[0]
+    output_names[path] = os.path.join(*(dir_parts[common_length:] + [name]))
+  return output_names
+
+
+def _open_output(path):
+  if sys.version_info[0] < 3:  # pragma: no cover
+    return open(path, "wb")
+  return open(path, "w", newline="")
+
+
+def write_rows(rows, output_path, output_format):
+  # Rows are written one at a time, so a spilled result is streamed from
+  # disk to the output file without being loaded back into memory.
+  row_count = 0
+  with _open_output(output_path) as output_file:
+    csv_writer = None
+    for row in rows:
+      if output_format == "ndjson":
+        output_file.write(json.dumps(row))
+        output_file.write("\n")
+      else:
+        if csv_writer is None:
+          csv_writer = csv.DictWriter(
+              output_file, fieldnames=list(row.keys()),
+              restval="", extrasaction="ignore")
+          csv_writer.writeheader()
+        csv_writer.writerow(row)
+      row_count += 1
+  return row_count
+
+
+class SqlFileRunner(object):
+
+  def __init__(self, client, data_source_id, output_dir, output_format,
+               output_names=None):
+    self._client = client
+    self._data_source_id = data_source_id
+    self._output_dir = output_dir
+    self._output_format = output_format
+    # sql path -> output file name without extension, see get_output_names()
+    self._output_names = output_names or {}
+
+  def get_output_path(self, sql_path):
+    name = self._output_names.get(sql_path, None)
+    if name is None:
+      name = os.path.splitext(os.path.basename(sql_path))[0]
+    return os.path.join(
+        self._output_dir, "{0}.{1}".format(name, self._output_format))
+
+  def run(self, sql_path):
+    # Returns (sql_path, output_path, row_count, seconds, error message).
+    start_time = time.time()
+    output_path = self.get_output_path(sql_path)
+    try:
+      with io.open(sql_path, encoding="utf-8") as sql_file:
+        sql_query = sql_file.read()
+
+      output_dir = os.path.dirname(output_path)
+      if not os.path.isdir(output_dir):
+        try:
+          os.makedirs(output_dir)
+        except OSError:
+          # Another file's run may have just made it.
+          if not os.path.isdir(output_dir):
+            raise
+
+      rows = self._client.get_query_results(sql_query, self._data_source_id)
+      row_count = write_rows(rows, output_path, self._output_format)
+      if hasattr(rows, "close"):
+        rows.close()
+      error = None
+    except RedashClient.RedashClientException as e:
+      row_count = 0
+      error = str(e.args[0])
+    except (IOError, OSError, ValueError) as e:
+      # ValueError covers a .sql file that isn't valid UTF-8.
+      row_count = 0
+      error = str(e)
+
+    return sql_path, output_path, row_count, time.time() - start_time, error
+
+
+def get_argument_parser():
+  parser = argparse.ArgumentParser(
+      prog="redash-run-sql",
+      description=("Run .sql files through Redash concurrently and write "
+                   "each result to its own NDJSON or CSV file."))
+  parser.add_argument(
+      "paths", nargs="+",
+      help=".sql files, directories of them or glob patterns")
+  parser.add_argument(
+      "-d", "--data-source", type=int, required=True,
+      help="id of the Redash data source to run the queries on")
+  parser.add_argument(
+      "-w", "--workers", type=int, default=4,
+      help="number of queries to run at once (default: 4)")
+  parser.add_argument(
+      "-f", "--format", choices=OUTPUT_FORMATS, default="ndjson",
+      help="output file format (default: ndjson)")
+  parser.add_argument(
+      "-o", "--output-dir", default=".",
+      help="directory to write results to (default: current directory)")
+  parser.add_argument(
+      "--api-key", default=os.environ.get("REDASH_API_KEY", None),
+      help="Redash API key (default: $REDASH_API_KEY)")
+  parser.add_argument(
+      "--base-url", default=None,
+      help="Redash server URL (default: {0})".format(RedashClient.BASE_URL))
+  return parser
+
+
+def main(argv=None, client=None):
+  parser = get_argument_parser()
+  args = parser.parse_args(argv)
+  if client is None and not args.api_key:
+    parser.error("an API key is required: set REDASH_API_KEY or --api-key")
+  if args.workers < 1:
+    parser.error("--workers must be at least 1")
+
+  sql_paths = get_sql_paths(args.paths)
+  if not sql_paths:
+    parser.error("no .sql files found")
+
+  # Two results must never be written to the same file.
+  output_names = get_output_names(sql_paths)
+  name_paths = {}
+  for sql_path in sql_paths:
+    name_paths.setdefault(output_names[sql_path], []).append(sql_path)
+  duplicates = [paths for paths in name_paths.values() if len(paths) > 1]
+  if duplicates:
+    parser.error("these files would write the same output file: {0}".format(
+        ", ".join(duplicates[0])))
+
+  if not os.path.isdir(args.output_dir):
+    os.makedirs(args.output_dir)
+
+  owns_client = client is None
+  if owns_client:
+    client = RedashClient(args.api_key, base_url=args.base_url)
+  runner = SqlFileRunner(
+      client, args.data_source, args.output_dir, args.format, output_names)
+
+  start_time = time.time()
+  total_rows = 0
+  failures = 0
+  pool = ThreadPool(min(args.workers, len(sql_paths)))
+  try:
+    for run_result in pool.imap_unordered(runner.run, sql_paths):
+      sql_path, output_path, row_count, seconds, error = run_result
+      if error is None:
+        total_rows += row_count
+        print("{0}: {1} rows in {2:.1f}s -> {3}".format(
+            sql_path, row_count, seconds, output_path))
+      else:
+        failures += 1
+        print("{0}: failed after {1:.1f}s: {2}".format(
+            sql_path, seconds, error))
+      sys.stdout.flush()
+  finally:
+    pool.terminate()
+    if owns_client:
+      client.close()
+
+  print("{0} queries ({1} failed), {2} rows in {3:.1f}s".format(
+      len(sql_paths), failures, total_rows, time.time() - start_time))
+  return 1 if failures else 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+  sys.exit(main())
@@ -1,33 +1,125 @@
 import json
 import time
+import tempfile
 import logging
+import threading
 import requests
+from collections import deque
+from itertools import islice
+from multiprocessing.pool import ThreadPool
 from slugify import slugify
 
 # Taking into account different versions of Python
 try:  # pragma: no cover
+  import Queue as queue
   from urllib import urlencode
-  from urlparse import urljoin
+  from urlparse import urljoin, urlparse
 except ImportError:  # pragma: no cover
+  import queue
   from urllib.parse import urlencode
-  from urllib.parse import urljoin
+  from urllib.parse import urljoin, urlparse
 
-from redash_client.constants import VizType, VizWidth, ChartType, TimeInterval
+from redash_client.constants import (
+    VizType, VizWidth, ChartType, TimeInterval, OversizedResult, RefreshMode)
+from redash_client.partitions import render_sql_template
+from redash_client.results import (
+    SpilledRows, StreamedResult, get_result_stats)
+from redash_client.schema import SchemaIndex, find_table_references
+from redash_client.journal import JobStatus
+from redash_client.resilience import LatencyTracker, is_transient_error
+from redash_client.tracing import NullTracer, traced
 
 
 class RedashClient(object):
   BASE_URL = "https://sql.telemetry.mozilla.org/"
   API_BASE_URL = BASE_URL + "api/"
   MAX_RETRY_COUNT = 5
+  MAX_PARTITION_RETRY_COUNT = 2
+  BACKGROUND_WORKER_COUNT = 8
+  SCHEMA_TTL = 60 * 60
+  DEFAULT_TIMEOUT = (10, 60)
+  MAX_GET_RETRY_COUNT = 2
+  GET_RETRY_BACKOFF = 0.5
+  HEDGE_PERCENTILE = 95
+  DASHBOARD_COLUMNS = 6
+  WIDGET_HEIGHT = 8
+  # Streamed results larger than this are read into a temporary file rather
+  # than memory when only max_result_rows is set; max_result_bytes is used
+  # otherwise.
+  RESULT_MEMORY_BYTES = 32 * 1024 * 1024
+  RESULT_CHUNK_BYTES = 64 * 1024
 
   class RedashClientException(Exception):
     pass
 
-  def __init__(self, api_key):
+  def __init__(self, api_key, max_result_rows=None, max_result_bytes=None,
+               oversized_result=OversizedResult.SPILL,
+               result_stats_callback=None, tracer=None, journal=None,
+               base_url=None, timeout=DEFAULT_TIMEOUT, endpoint_timeouts=None,
+               hedge_requests=False, circuit_breaker=None,
+               result_decoder=None, hedge_query_results=False):
+    if oversized_result not in OversizedResult.allowed_behaviors:
+      raise ValueError(("oversized_result should be one of "
+                        "OversizedResult.SPILL or OversizedResult.RAISE"))
+
     self._api_key = api_key
     self._url_params = {"api_key": self._api_key}
+
+    # Points this client at another Redash server than stmo.
+    if base_url:
+      self.BASE_URL = base_url.rstrip("/") + "/"
+      self.API_BASE_URL = self.BASE_URL + "api/"
     self._retry_delay = 1
 
+    # Results past either limit are spilled to a temporary file (or rejected)
+    # instead of being returned as an in-memory list. None means no limit.
+    # With a limit set, results are streamed: the bytes limit is enforced
+    # while downloading, and a body past it is parsed from disk one row at
+    # a time. Without one, results are read into memory whole.
+    self._max_result_rows = max_result_rows
+    self._max_result_bytes = max_result_bytes
+    self._oversized_result = oversized_result
+    self._result_stats_callback = result_stats_callback
+
+    # Optional decoding.ResultDecoder that parses query results on worker
+    # processes. Its rows come back as decoding.ColumnarRows.
+    self._result_decoder = result_decoder
+
+    # See tracing.py: InMemoryTracer for tests, OpenTelemetryTracer to export.
+    self._tracer = tracer or NullTracer()
+
+    # Optional journal.JobJournal used to resume jobs across processes.
+    self._journal = journal
+
+    # Timeouts are (connect, read) seconds, as requests takes them.
+    # endpoint_timeouts maps API path prefixes, e.g. "query_results", to
+    # timeouts for just those endpoints.
+    self._timeout = timeout
+    self._endpoint_timeouts = endpoint_timeouts or {}
+
+    # With hedge_requests, a GET that's slower than HEDGE_PERCENTILE of the
+    # recent ones to the same endpoint is sent a second time and whichever
+    # answers first wins. Endpoints are the endpoint_timeouts prefixes, or
+    # else the first component of the API path. Query result downloads are
+    # only hedged with hedge_query_results too: they're the heaviest
+    # responses to send twice. circuit_breaker is an optional
+    # resilience.CircuitBreaker.
+    self._hedge_requests = hedge_requests
+    self._hedge_query_results = hedge_query_results
+    self._latency_trackers = {}
+    self._latency_lock = threading.Lock()
+    self._circuit_breaker = circuit_breaker
+
+    # Query refreshes that were not waited for. See flush_refreshes().
+    self._background_pool = None
+    self._pending_refreshes = []
+    self._deferred_refreshes = []
+    self._refresh_lock = threading.Lock()
+
+    # SchemaIndex per data source id, refetched after SCHEMA_TTL seconds.
+    self._schema_indexes = {}
+    self._schema_lock = threading.Lock()
+
     logging.basicConfig()
     self._logger = logging.getLogger()
     self._logger.setLevel(logging.INFO)
@@ -74,40 +166,259 @@ class RedashClient(object):
 
     return options
 
-  def _make_request(self, request_function, url, req_args={}):
+  def _get_http_method(self, request_function):
+    # Looked up on each call rather than stored, so it keeps working when
+    # the requests functions are patched in tests.
+    http_methods = {
+        requests.get: "GET",
+        requests.post: "POST",
+        requests.delete: "DELETE",
+    }
+    return http_methods.get(request_function, "UNKNOWN")
+
+  def _make_request(self, request_function, url, req_args={},
+                    query_result=False, timeout=None):
     if not request_function:
       request_function = requests.post
+    if timeout is None:
+      timeout = self._timeout
+
+    # Only GETs are safe to send more than once.
+    retry_count = 0
+    if request_function == requests.get:
+      retry_count = self.MAX_GET_RETRY_COUNT
+
+    url_path = urlparse(url).path
+    latency_tracker = self._get_latency_tracker(url_path)
+
+    # Only the path is recorded: the query string holds the API key.
+    span_name = "HTTP " + self._get_http_method(request_function)
+    for attempt in range(retry_count + 1):
+      try:
+        with self._tracer.span(span_name, url_path=url_path, attempt=attempt):
+          return self._send_request(
+              request_function, url, req_args, query_result, timeout,
+              latency_tracker)
+      except self.RedashClientException as e:
+        if attempt == retry_count or not is_transient_error(e):
+          raise
+
+        self._logger.info((
+            "RedashClient: Retrying request after error: {error}").format(
+            error=e.args[0]))
+        time.sleep(self.GET_RETRY_BACKOFF * 2 ** attempt)
+
+  def _send_hedged_request(self, request_function, url, timeout,
+                           latency_tracker):
+    hedge_delay = latency_tracker.get_percentile(self.HEDGE_PERCENTILE)
+    if hedge_delay is None:
+      return request_function(url, timeout=timeout)
+
+    responses = queue.Queue()
+
+    def send_request():
+      try:
+        responses.put((True, request_function(url, timeout=timeout)))
+      except Exception as e:
+        responses.put((False, e))
+
+    def start_request():
+      request_thread = threading.Thread(target=send_request)
+      request_thread.daemon = True
+      request_thread.start()
+
+    start_request()
+    request_count = 1
+    try:
+      succeeded, result = responses.get(timeout=hedge_delay)
+    except queue.Empty:
+      self._tracer.set_attribute("hedged", True)
+      start_request()
+      request_count = 2
+      succeeded, result = responses.get()
+
+    # If the first answer is an error, the other request may still succeed.
+    if not succeeded and request_count == 2:
+      succeeded, result = responses.get()
+
+    if not succeeded:
+      raise result
+    return result
+
+  def _send_request(self, request_function, url, req_args,
+                    query_result, timeout, latency_tracker):
+    circuit_breaker = self._circuit_breaker
+    if circuit_breaker and not circuit_breaker.allow_request():
+      raise self.RedashClientException(
+          "Not contacting redash while the circuit breaker is open",
+          circuit_breaker)
+
+    # Results that may need spilling are streamed, so an oversized one is
+    # never downloaded into memory as a whole.
+    stream_result = query_result and (
+        self._max_result_rows is not None or
+        self._max_result_bytes is not None)
 
+    start_time = time.time()
     try:
-      if request_function != requests.post:
-        response = request_function(url)
+      if stream_result:
+        response = self._send_streamed_request(request_function, url,
+                                               req_args, timeout)
+      elif (request_function == requests.get and self._hedge_requests and
+            (self._hedge_query_results or not query_result)):
+        response = self._send_hedged_request(
+            request_function, url, timeout, latency_tracker)
+      elif request_function != requests.post:
+        response = request_function(url, timeout=timeout)
       else:
-        response = request_function(url, req_args)
+        response = request_function(url, req_args, timeout=timeout)
     except requests.RequestException as e:
+      if circuit_breaker:
+        circuit_breaker.record_failure()
       raise self.RedashClientException(
           ("Unable to communicate with redash: {error}").format(error=e), e)
 
+    if circuit_breaker and response.status_code >= 500:
+      circuit_breaker.record_failure()
+    elif circuit_breaker:
+      circuit_breaker.record_success()
+
     if response.status_code != 200:
+      self._tracer.set_attribute("status_code", response.status_code)
       raise self.RedashClientException(
           ("Error status returned: {error_code} {error_message}").format(
               error_code=response.status_code,
               error_message=response.content,
           ), response.status_code)
-    try:
-      json_result = response.json(), response
-    except ValueError as e:
-      raise self.RedashClientException(
-          ("Unable to parse JSON response: {error}").format(error=e))
 
+    if request_function == requests.get:
+      latency_tracker.record(time.time() - start_time)
+
+    if stream_result:
+      json_result = self._read_streamed_result(response), response
+    else:
+      response.result_bytes = len(response.content)
+      try:
+        if query_result and self._result_decoder:
+          json_result = self._result_decoder.decode(response.content), response
+        else:
+          json_result = response.json(), response
+      except ValueError as e:
+        raise self.RedashClientException(
+            ("Unable to parse JSON response: {error}").format(error=e))
+
+    self._tracer.set_attribute("status_code", response.status_code)
+    self._tracer.set_attribute("response_bytes", response.result_bytes)
+    return json_result
+
+  def _send_streamed_request(self, request_function, url, req_args,
+                             timeout):
+    if request_function != requests.post:
+      return request_function(url, timeout=timeout, stream=True)
+    return request_function(url, req_args, timeout=timeout, stream=True)
+
+  def _check_result_bytes(self, byte_count, response):
+    if (self._oversized_result == OversizedResult.RAISE and
+       self._max_result_bytes is not None and
+       byte_count > self._max_result_bytes):
+      response.close()
+      raise self.RedashClientException(
+          ("Response of {size} bytes exceeds the limit of {limit} "
+           "bytes").format(size=byte_count, limit=self._max_result_bytes),
+          byte_count)
+
+  def _read_streamed_result(self, response):
+    # Reads the body into memory up to the spill threshold and into a
+    # temporary file past it. A body on disk is parsed one row at a time,
+    # straight into a results.SpilledRows. With OversizedResult.RAISE,
+    # the byte limit is checked against Content-Length before reading and
+    # again while reading.
+    spill_threshold = self._max_result_bytes
+    if spill_threshold is None:
+      spill_threshold = self.RESULT_MEMORY_BYTES
+
+    content_length = response.headers.get("Content-Length", None)
+    if content_length:
+      self._check_result_bytes(int(content_length), response)
+
+    byte_count = 0
+    with tempfile.SpooledTemporaryFile(max_size=spill_threshold) as body:
+      try:
+        for chunk in response.iter_content(self.RESULT_CHUNK_BYTES):
+          byte_count += len(chunk)
+          self._check_result_bytes(byte_count, response)
+          body.write(chunk)
+      except requests.RequestException as e:
+        raise self.RedashClientException(
+            ("Unable to communicate with redash: {error}").format(error=e), e)
+      response.result_bytes = byte_count
+      body.seek(0)
+
+      try:
+        if byte_count <= spill_threshold:
+          if self._result_decoder:
+            return self._result_decoder.decode(body.read())
+          return json.loads(body.read().decode("utf-8"))
+
+        streamed_result = StreamedResult(body)
+        rows = SpilledRows(
+            streamed_result.iter_rows(), {"bytes": byte_count})
+      except ValueError as e:
+        raise self.RedashClientException(
+            ("Unable to parse JSON response: {error}").format(error=e))
+
+    json_result = streamed_result.json_response
+    data = json_result.get("query_result", {}).get("data", None)
+    if data is None:
+      # Not a result after all, e.g. a job.
+      rows.close()
+    else:
+      data["rows"] = rows
     return json_result
 
-  def _make_api_request(self, request_function, url_path, req_args={}):
+  def _get_endpoint_prefix(self, url_path):
+    # The longest endpoint_timeouts prefix url_path starts with, if any.
+    matching_prefixes = [
+        prefix for prefix in self._endpoint_timeouts
+        if url_path.startswith(prefix)
+    ]
+    if not matching_prefixes:
+      return None
+    return max(matching_prefixes, key=len)
+
+  def _get_timeout(self, url_path):
+    prefix = self._get_endpoint_prefix(url_path)
+    if prefix is None:
+      return self._timeout
+    return self._endpoint_timeouts[prefix]
+
+  def _get_latency_tracker(self, url_path):
+    # url_path is the full path of the request URL, e.g. /api/jobs/123.
+    api_path = urlparse(self.API_BASE_URL).path
+    if url_path.startswith(api_path):
+      url_path = url_path[len(api_path):]
+
+    endpoint = self._get_endpoint_prefix(url_path)
+    if endpoint is None:
+      endpoint = url_path.split("/", 1)[0]
+
+    with self._latency_lock:
+      if endpoint not in self._latency_trackers:
+        self._latency_trackers[endpoint] = LatencyTracker()
+      return self._latency_trackers[endpoint]
+
+  def _make_api_request(self, request_function, url_path, req_args={},
+                        query_result=False):
+    # query_result marks responses that can carry query results, which are
+    # subject to the result size limit and to the result decoder.
     req = requests.models.PreparedRequest()
     req_url = urljoin(self.API_BASE_URL, url_path)
     req.prepare_url(req_url, self._url_params)
-    return self._make_request(request_function, req.url, req_args)
+    return self._make_request(
+        request_function, req.url, req_args, query_result,
+        self._get_timeout(url_path))
 
-  def _get_new_query_id(self, name, sql_query, data_source_id, description):
+  def _post_new_query(self, name, sql_query, data_source_id, description):
     url_path = "queries"
 
     new_query_args = json.dumps({
@@ -119,9 +430,7 @@ class RedashClient(object):
 
     json_result, response = self._make_api_request(
         requests.post, url_path, new_query_args)
-
-    query_id = json_result.get("id", None)
-    return query_id
+    return json_result
 
   def _get_visualization(self, query_id):
     url_path = "queries/{0}".format(str(query_id))
@@ -140,69 +449,430 @@ class RedashClient(object):
     url_path = "queries/{0}/refresh".format(str(query_id))
     self._make_api_request(requests.post, url_path)
 
+  def _get_background_pool(self):
+    with self._refresh_lock:
+      if self._background_pool is None:
+        self._background_pool = ThreadPool(self.BACKGROUND_WORKER_COUNT)
+    return self._background_pool
+
+  def _check_refresh_mode(self, refresh):
+    if refresh not in RefreshMode.allowed_refresh_modes:
+      raise ValueError(("refresh should be one of RefreshMode.BLOCKING, "
+                        "RefreshMode.BACKGROUND or RefreshMode.DEFERRED"))
+
+  def _refresh_query(self, query_id, refresh):
+    if refresh == RefreshMode.BLOCKING:
+      self._refresh_graph(query_id)
+    elif refresh == RefreshMode.BACKGROUND:
+      pending_refresh = self._get_background_pool().apply_async(
+          self._tracer.bind(self._refresh_graph), (query_id,))
+      with self._refresh_lock:
+        self._pending_refreshes.append(pending_refresh)
+    else:
+      with self._refresh_lock:
+        if query_id not in self._deferred_refreshes:
+          self._deferred_refreshes.append(query_id)
+
+  @traced
+  def flush_refreshes(self):
+    # Sends every deferred refresh concurrently and waits for those and any
+    # background refreshes to finish. Returns the number of refreshes waited
+    # for, and raises once all are done if any of them failed.
+    with self._refresh_lock:
+      deferred_refreshes = self._deferred_refreshes
+      pending_refreshes = self._pending_refreshes
+      self._deferred_refreshes = []
+      self._pending_refreshes = []
+
+    if deferred_refreshes:
+      pool = self._get_background_pool()
+      refresh_graph = self._tracer.bind(self._refresh_graph)
+      for query_id in deferred_refreshes:
+        pending_refreshes.append(
+            pool.apply_async(refresh_graph, (query_id,)))
+
+    errors = []
+    for pending_refresh in pending_refreshes:
+      try:
+        pending_refresh.get()
+      except self.RedashClientException as e:
+        errors.append(e)
+
+    if errors:
+      raise self.RedashClientException((
+          "{count} of {total} query refreshes failed: {error}").format(
+          count=len(errors), total=len(pending_refreshes),
+          error=errors[0].args[0]), errors)
+
+    self._tracer.set_attribute("refreshes", len(pending_refreshes))
+    return len(pending_refreshes)
+
+  def close(self):
+    # Flushes outstanding refreshes (see flush_refreshes()) and stops the
+    # background threads. A client that's used again afterwards starts new
+    # ones. Also called on leaving a with block.
+    try:
+      return self.flush_refreshes()
+    finally:
+      with self._refresh_lock:
+        pool = self._background_pool
+        self._background_pool = None
+      if pool is not None:
+        pool.terminate()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    try:
+      self.close()
+    except self.RedashClientException:
+      # A failed refresh mustn't hide the error that ended the with block.
+      if exc_type is None:
+        raise
+
+  @traced
   def get_data_sources(self):
       url_path = "data_sources"
       json_response, response = self._make_api_request(requests.get, url_path)
       return json_response
 
+  @traced
+  def get_schema_index(self, data_source_id, refresh=False):
+    with self._schema_lock:
+      schema_index = self._schema_indexes.get(data_source_id, None)
+
+    if (refresh or schema_index is None or
+       schema_index.is_expired(self.SCHEMA_TTL)):
+      url_path = "data_sources/{0}/schema".format(data_source_id)
+      json_response, response = self._make_api_request(requests.get, url_path)
+      schema_index = SchemaIndex.from_schema_response(json_response)
+      # A schema that's still being fetched is asked for again next time.
+      if "job" not in json_response:
+        with self._schema_lock:
+          self._schema_indexes[data_source_id] = schema_index
+
+    self._tracer.set_attribute("tables", len(schema_index))
+    return schema_index
+
+  def validate_query(self, sql_query, data_source_id):
+    # Raises if sql_query reads from a table the data source doesn't have.
+    # Only FROM and JOIN references are checked; see find_table_references.
+    # Queries aren't checked at all when the data source has no schema.
+    schema_index = self.get_schema_index(data_source_id)
+    if not schema_index.is_available:
+      self._logger.info((
+          "RedashClient: Not validating query, data source {data_source_id} "
+          "has no schema: {reason}").format(
+              data_source_id=data_source_id,
+              reason=schema_index.unavailable_reason))
+      return
+
+    unknown_tables = [
+        table_name for table_name in find_table_references(sql_query)
+        if not schema_index.has_table(table_name)
+    ]
+
+    if unknown_tables:
+      raise self.RedashClientException((
+          "Query references tables unknown to data source {data_source_id}: "
+          "{tables}").format(data_source_id=data_source_id,
+                             tables=", ".join(unknown_tables)),
+          unknown_tables)
+
+  @traced
   def create_new_query(self, name, sql_query,
-                       data_source_id, description=None):
-    query_id = self._get_new_query_id(
+                       data_source_id, description=None,
+                       refresh=RefreshMode.BLOCKING, validate=False):
+    # Note: refresh is one of the RefreshMode values. BACKGROUND and DEFERRED
+    # return without waiting for the refresh; call flush_refreshes() to send
+    # deferred refreshes and wait for all outstanding ones.
+    #
+    # validate checks table names against the cached data source schema
+    # before anything is sent, see validate_query().
+    self._check_refresh_mode(refresh)
+    if validate:
+      self.validate_query(sql_query, data_source_id)
+
+    json_result = self._post_new_query(
         name, sql_query, data_source_id, description)
+    query_id = json_result.get("id", None)
 
     # If we can't get a query ID, the query has no table. Exit now.
     if not query_id:
       return None, None
 
-    visualization = self._get_visualization(query_id)
+    # Newer Redash versions return the default table visualization with the
+    # new query, which saves fetching the query again.
+    visualizations = json_result.get("visualizations", None)
+    pending_refresh = None
+    if visualizations is not None:
+      visualization = visualizations[0] if visualizations else None
+    else:
+      # The refresh doesn't depend on the visualization, so send both at once
+      if refresh == RefreshMode.BLOCKING:
+        pending_refresh = self._get_background_pool().apply_async(
+            self._tracer.bind(self._refresh_graph), (query_id,))
+      try:
+        visualization = self._get_visualization(query_id)
+      except self.RedashClientException:
+        # Left for flush_refreshes(), so the refresh is still waited for
+        # and its failure reported.
+        if pending_refresh:
+          with self._refresh_lock:
+            self._pending_refreshes.append(pending_refresh)
+        raise
 
     table_id = None
     if visualization:
       table_id = visualization.get("id", None)
 
-    self._refresh_graph(query_id)
+    if pending_refresh:
+      pending_refresh.get()
+    else:
+      self._refresh_query(query_id, refresh)
 
+    self._tracer.set_attribute("query_id", query_id)
+    self._tracer.set_attribute("table_id", table_id)
     return query_id, table_id
 
-  def _poll_job(self, job):
+  def _wait_for_job(self, job):
     for attempt in range(self.MAX_RETRY_COUNT):
-      url_path = "jobs/{}".format(job['id'])
-      json_response, response = self._make_api_request(requests.get, url_path)
-      job = json_response.get('job', None)
+      with self._tracer.span("poll_job", job_id=job['id'], attempt=attempt):
+        url_path = "jobs/{}".format(job['id'])
+        json_response, response = self._make_api_request(
+            requests.get, url_path)
+        job = json_response.get('job', None)
+        self._tracer.set_attribute("status", job.get('status', None))
 
-      # If the status shows the job is done processing
-      # TODO: Add better comment for these statuses.
-      if job.get('status', None) in (3, 4):
+      # Stop once the job has either succeeded or failed
+      if job.get('status', None) in (JobStatus.SUCCESS, JobStatus.FAILURE):
           break
       time.sleep(self._retry_delay)
 
-    if job['status'] == 3:
-      return job['query_result_id']
-    return None
+    return job
+
+  def _get_job_results(self, job, sql_query, data_source_id):
+    # If there aren't yet results, we poll for job completion and then get
+    # the results when they're ready. Returns (json response, response,
+    # last job status seen).
+    if job.get('status', None) != JobStatus.SUCCESS:
+      job = self._wait_for_job(job)
+      if self._journal:
+        self._journal.record_status(
+            sql_query, data_source_id, job['status'],
+            job.get('query_result_id', None))
+
+    result_id = None
+    if job['status'] == JobStatus.SUCCESS:
+      result_id = job['query_result_id']
+
+    self._tracer.set_attribute("query_result_id", result_id)
+    if not result_id:
+      return None, None, job
+
+    url_path = "query_results/{}".format(result_id)
+    json_response, response = self._make_api_request(
+        requests.get, url_path, query_result=True)
+    return json_response, response, job
+
+  def _get_journaled_job(self, sql_query, data_source_id):
+    if not self._journal:
+      return None
+
+    entry = self._journal.get(sql_query, data_source_id)
+    if entry is None or entry["status"] == JobStatus.FAILURE:
+      return None
+
+    self._logger.info((
+        "RedashClient: Resuming job {job_id} submitted at "
+        "{submitted_at}").format(**entry))
+    return {
+        "id": entry["job_id"],
+        "status": entry["status"],
+        "query_result_id": entry["query_result_id"],
+    }
 
-  def get_query_results(self, sql_query, data_source_id):
+  def _execute_query(self, sql_query, data_source_id):
+    # Returns as _get_job_results() does, with no job if the result came
+    # back straight away.
     url_path = "query_results"
 
+    # A job journaled by an earlier run may be running or done already.
+    job = self._get_journaled_job(sql_query, data_source_id)
+    if job:
+      try:
+        return self._get_job_results(job, sql_query, data_source_id)
+      except self.RedashClientException as e:
+        if e.args[1:] != (404,):
+          raise
+
+        # Redash no longer knows the job or its result: run it again.
+        self._journal.remove(sql_query, data_source_id)
+
     get_query_results_args = json.dumps({
         "query": sql_query,
         "data_source_id": data_source_id,
     })
 
-    # If there aren't yet results, we'll get a job ID, so we poll for job
-    # completion and then get the results when they're ready.
+    # If there aren't yet results, we'll get a job ID instead.
     json_response, response = self._make_api_request(
-        requests.post, url_path, get_query_results_args)
-    if "job" in json_response:
-      result_id = self._poll_job(json_response['job'])
-      if result_id:
-        url_path = "{}/{}".format(url_path, result_id)
-        json_response, response = self._make_api_request(
-            requests.get, url_path)
+        requests.post, url_path, get_query_results_args, query_result=True)
+    if "job" not in json_response:
+      return json_response, response, None
+
+    job = json_response['job']
+    if self._journal:
+      self._journal.record_submitted(
+          sql_query, data_source_id, job['id'],
+          job.get('status', JobStatus.PENDING))
+
+    return self._get_job_results(job, sql_query, data_source_id)
 
+  def _get_result_rows(self, json_response, response):
     rows = json_response.get(
         "query_result", {}).get("data", {}).get("rows", [])
+
+    spilled = isinstance(rows, SpilledRows)
+    if spilled:
+      stats = rows.stats
+    else:
+      stats = get_result_stats(rows, response.result_bytes)
+    oversized = (
+        (self._max_result_rows is not None and
+         stats["rows"] > self._max_result_rows) or
+        (self._max_result_bytes is not None and
+         stats["bytes"] > self._max_result_bytes))
+
+    if oversized and self._oversized_result == OversizedResult.RAISE:
+      if spilled:
+        rows.close()
+      raise self.RedashClientException((
+          "Query result of {rows} rows and {bytes} bytes exceeds the "
+          "configured result size limit").format(**stats), stats)
+
+    if oversized and not spilled:
+      rows = SpilledRows(rows, stats)
+      stats = rows.stats
+    elif spilled and not oversized:
+      # Only max_result_rows is set and the result was spilled for its size
+      # in bytes, but its rows are within the limit.
+      spilled_rows = rows
+      rows = list(spilled_rows)
+      spilled_rows.close()
+      stats = get_result_stats(rows, stats["bytes"])
+
+    if oversized:
+      self._logger.info((
+          "RedashClient: Query result of {rows} rows and {bytes} bytes "
+          "spilled to {path}").format(**stats))
+
+    if self._result_stats_callback:
+      self._result_stats_callback(stats)
+    return rows
+
+  @traced
+  def get_query_results(self, sql_query, data_source_id, validate=False):
+    # Note: results past max_result_rows or max_result_bytes come back as a
+    # results.SpilledRows, which iterates rows from disk. Call its close()
+    # (or use it as a context manager) to remove the temporary file early.
+    if validate:
+      self.validate_query(sql_query, data_source_id)
+
+    json_response, response, job = self._execute_query(
+        sql_query, data_source_id)
+    if json_response is None:
+      return []
+
+    rows = self._get_result_rows(json_response, response)
+    self._tracer.set_attribute("rows", len(rows))
     return rows
 
+  def _get_partition_results(self, partition_args):
+    index, sql_query, data_source_id = partition_args
+
+    # Each partition is retried on its own so one flaky slice doesn't
+    # force the whole date range to be queried again. Only transient
+    # failures and jobs that didn't finish in time are retried: a rejected
+    # request or a failed query would just fail again.
+    for attempt in range(self.MAX_PARTITION_RETRY_COUNT + 1):
+      try:
+        with self._tracer.span("partition", index=index, attempt=attempt):
+          json_response, response, job = self._execute_query(
+              sql_query, data_source_id)
+          if json_response is not None:
+            return self._get_result_rows(json_response, response)
+      except self.RedashClientException as e:
+        if not is_transient_error(e):
+          raise self.RedashClientException(
+              "Partition {index} failed: {error}".format(
+                  index=index, error=e.args[0]), *e.args[1:])
+        error = e.args[0]
+      else:
+        if job["status"] == JobStatus.FAILURE:
+          raise self.RedashClientException(
+              "Partition {index} failed: {error}".format(
+                  index=index, error=job.get("error", None) or "query failed"))
+        error = "query job did not finish"
+
+      self._logger.info((
+          "RedashClient: Partition {index} failed on attempt {attempt}: "
+          "{error}").format(index=index, attempt=attempt + 1, error=error))
+
+    raise self.RedashClientException((
+        "Partition {index} failed after {count} attempts: {error}").format(
+        index=index, count=self.MAX_PARTITION_RETRY_COUNT + 1, error=error))
+
+  def _iter_partition_results(self, partition_args, max_workers):
+    # At most max_workers partitions are submitted ahead of the one being
+    # consumed, so finished partitions can't pile up while the caller is
+    # still reading earlier ones.
+    pool = ThreadPool(min(max_workers, len(partition_args)))
+    try:
+      get_partition_results = self._tracer.bind(self._get_partition_results)
+      pending_partitions = deque()
+      next_partition_args = iter(partition_args)
+      for args in islice(next_partition_args, max_workers):
+        pending_partitions.append(
+            pool.apply_async(get_partition_results, (args,)))
+
+      while pending_partitions:
+        rows = pending_partitions.popleft().get()
+        for args in islice(next_partition_args, 1):
+          pending_partitions.append(
+              pool.apply_async(get_partition_results, (args,)))
+        for row in rows:
+          yield row
+    finally:
+      pool.terminate()
+
+  def get_partitioned_query_results(self, sql_template, data_source_id,
+                                    partitions, max_workers=4,
+                                    validate=False):
+    # Note: sql_template uses Redash {{ parameter }} placeholders, and
+    # partitions is a list of dicts of parameter values, e.g. the output of
+    # partitions.date_partitions() or partitions.key_partitions().
+    #
+    # Partitions run concurrently on at most max_workers threads. Rows are
+    # yielded partition by partition in the order the partitions were given,
+    # and at most max_workers partitions are held ahead of the one being
+    # read, so callers can consume the merged result without holding all of
+    # it. validate checks the query when this is called, before any rows
+    # are asked for.
+    partition_args = [
+        (index, render_sql_template(sql_template, parameters), data_source_id)
+        for index, parameters in enumerate(partitions)
+    ]
+    if not partition_args:
+      return iter([])
+
+    # Partitions only differ in parameter values, so checking one is enough.
+    if validate:
+      self.validate_query(partition_args[0][1], data_source_id)
+
+    return self._iter_partition_results(partition_args, max_workers)
+
+  @traced
   def make_new_visualization_request(self, query_id, viz_type, options, title):
     url_path = "visualizations"
 
@@ -218,6 +888,7 @@ class RedashClient(object):
     visualization_id = json_result.get("id", None)
     return visualization_id
 
+  @traced
   def create_new_visualization(
       self,
       query_id, viz_type=VizType.CHART,
@@ -257,6 +928,7 @@ class RedashClient(object):
         query_id, viz_type, options, title)
     return visualization_id
 
+  @traced
   def create_new_dashboard(self, name):
     slug = self.get_slug(name)
 
@@ -291,6 +963,7 @@ class RedashClient(object):
     }
     return dash_info
 
+  @traced
   def get_public_url(self, dash_id):
     url_path = "dashboards/{}/share".format(str(dash_id))
 
@@ -298,6 +971,7 @@ class RedashClient(object):
     public_url = json_result.get("public_url", None)
     return public_url
 
+  @traced
   def publish_dashboard(self, dash_id):
     url_path = "dashboards/{}".format(str(dash_id))
 
@@ -305,30 +979,100 @@ class RedashClient(object):
 
     self._make_api_request(requests.post, url_path, publish_dashboard_args)
 
+  @traced
   def remove_visualization(self, viz_id):
     url_path = "widgets/{}".format(str(viz_id))
     self._make_api_request(requests.delete, url_path)
 
+  @traced
   def delete_query(self, query_id):
     url_path = "queries/{}".format(str(query_id))
     self._make_api_request(requests.delete, url_path)
 
-  def add_visualization_to_dashboard(self, dash_id, viz_id, viz_width):
+  def _check_viz_width(self, viz_width):
     if viz_width != VizWidth.REGULAR and viz_width != VizWidth.WIDE:
       raise ValueError(("viz_width should be one of "
                         "VizWidth.WIDE or VizWidth.REGULAR"))
 
+  @traced
+  def add_visualization_to_dashboard(self, dash_id, viz_id, viz_width,
+                                     options=None, text=""):
+    # Note: a text widget is added with viz_id None and its text.
+    self._check_viz_width(viz_width)
+
     url_path = "widgets"
 
     add_visualization_args = json.dumps({
         "dashboard_id": dash_id,
         "visualization_id": viz_id,
         "width": viz_width,
-        "options": {},
-        "text": "",
+        "options": options or {},
+        "text": text,
     })
 
-    self._make_api_request(requests.post, url_path, add_visualization_args)
+    json_result, response = self._make_api_request(
+        requests.post, url_path, add_visualization_args)
+    return json_result.get("id", None)
+
+  def make_widget_layout(self, viz_widths, start_row=0):
+    # Places widgets on Redash's six column dashboard grid in the given
+    # order: REGULAR widgets fill a row two at a time, WIDE ones take a row
+    # of their own. Returns one {"position": ...} widget options dict per
+    # width.
+    layout = []
+    row = start_row
+    col = 0
+    for viz_width in viz_widths:
+      self._check_viz_width(viz_width)
+      size_x = self.DASHBOARD_COLUMNS
+      if viz_width == VizWidth.REGULAR:
+        size_x = self.DASHBOARD_COLUMNS // 2
+
+      if col + size_x > self.DASHBOARD_COLUMNS:
+        row += self.WIDGET_HEIGHT
+        col = 0
+
+      layout.append({"position": {
+          "col": col,
+          "row": row,
+          "sizeX": size_x,
+          "sizeY": self.WIDGET_HEIGHT,
+          "autoHeight": False,
+      }})
+      col += size_x
+
+    return layout
+
+  def _add_widget(self, widget_args):
+    return self.add_visualization_to_dashboard(*widget_args)
+
+  @traced
+  def add_visualizations_to_dashboard(self, dash_id, visualizations,
+                                      start_row=0, max_workers=4):
+    # Note: visualizations is a list of (viz_id, viz_width) pairs. Their
+    # layout is computed up front, so the widgets end up in list order no
+    # matter which of the concurrent requests finishes first. Use start_row
+    # to place them below widgets already on the dashboard.
+    #
+    # Returns the new widget ids in the same order.
+    if not visualizations:
+      return []
+
+    layout = self.make_widget_layout(
+        [viz_width for viz_id, viz_width in visualizations], start_row)
+    widget_args = [
+        (dash_id, viz_id, viz_width, options)
+        for (viz_id, viz_width), options in zip(visualizations, layout)
+    ]
+
+    pool = ThreadPool(min(max_workers, len(widget_args)))
+    try:
+      widget_ids = pool.map(self._tracer.bind(self._add_widget), widget_args)
+    finally:
+      pool.terminate()
+
+    self._tracer.set_attribute("widgets", len(widget_ids))
+    return widget_ids
 
   def get_visualization_public_url(self, query_id, widget_id):
     url_params = urlencode(self._url_params)
@@ -338,6 +1082,7 @@ class RedashClient(object):
     query_url = urljoin(self.BASE_URL, url_path)
     return query_url
 
+  @traced
   def update_query_schedule(self, query_id, schedule):
     url_path = "queries/{}".format(str(query_id))
 
@@ -345,8 +1090,11 @@ class RedashClient(object):
 
     self._make_api_request(requests.post, url_path, update_query_args)
 
+  @traced
   def update_query(self, query_id, name, sql_query,
-                   data_source_id, description, options=None):
+                   data_source_id, description, options=None,
+                   refresh=RefreshMode.BLOCKING):
+    self._check_refresh_mode(refresh)
     url_path = "queries/{0}".format(str(query_id))
 
     update_query_args = {
@@ -362,8 +1110,9 @@ class RedashClient(object):
 
     self._make_api_request(requests.post, url_path,
                            json.dumps(update_query_args))
-    self._refresh_graph(query_id)
+    self._refresh_query(query_id, refresh)
 
+  @traced
   def fork_query(self, query_id):
     url_path = "queries/{0}/fork".format(query_id)
 
@@ -377,6 +1126,19 @@ class RedashClient(object):
 
     return fork
 
+  def _make_query_template(self, query, visualization):
+    visualization = visualization or {}
+    return {
+        "id": query.get("id", None),
+        "description": query.get("description", None),
+        "name": query.get("name", None),
+        "data_source_id": query.get("data_source_id", None),
+        "options": visualization.get("options", None),
+        "type": visualization.get("type", None),
+        "query": query.get("query", None)
+    }
+
+  @traced
   def search_queries(self, keyword):
     url_path = "queries?q={0}".format(keyword)
 
@@ -385,23 +1147,59 @@ class RedashClient(object):
 
     templated_queries = []
     for query in json_result["results"]:
-      query_id = query.get("id", None)
-      visualization = self._get_visualization(query_id)
-      options = visualization.get("options", None)
-      viz_type = visualization.get("type", None)
-
-      templated_queries.append({
-          "id": query_id,
-          "description": query.get("description", None),
-          "name": query.get("name", None),
-          "data_source_id": query.get("data_source_id", None),
-          "options": options,
-          "type": viz_type,
-          "query": query.get("query", None)
-      })
+      visualization = self._get_visualization(query.get("id", None))
+      templated_queries.append(
+          self._make_query_template(query, visualization))
 
     return templated_queries
 
+  @traced
+  def get_queries(self, page=1, page_size=250, order=None):
+    # Note: returns one page of the query list, in the form
+    # {"count": ..., "page": ..., "page_size": ..., "results": [...]}
+    url_path = "queries?page={0}&page_size={1}".format(page, page_size)
+    if order:
+      url_path = "{0}&order={1}".format(url_path, order)
+
+    json_result, response = self._make_api_request(requests.get, url_path)
+    return json_result
+
+  @traced
+  def get_query(self, query_id):
+    url_path = "queries/{0}".format(query_id)
+
+    json_result, response = self._make_api_request(requests.get, url_path)
+    return json_result
+
+  @traced
+  def get_query_result(self, query_result_id):
+    # Note: returns the stored result in the form
+    # {"id": ..., "query": ..., "data": {"columns": [...], "rows": [...]}, ...}
+    url_path = "query_results/{0}".format(query_result_id)
+
+    json_result, response = self._make_api_request(
+        requests.get, url_path, query_result=True)
+    return json_result.get("query_result", {})
+
+  @traced
+  def get_dashboards(self, page=1, page_size=250):
+    # Note: older Redash versions return a plain list of every dashboard
+    # instead of a page, which is passed on as {"results": [...]}.
+    url_path = "dashboards?page={0}&page_size={1}".format(page, page_size)
+
+    json_result, response = self._make_api_request(requests.get, url_path)
+    if isinstance(json_result, list):
+      json_result = {"count": len(json_result), "results": json_result}
+    return json_result
+
+  @traced
+  def get_dashboard(self, slug):
+    url_path = "dashboards/{0}".format(slug)
+
+    json_result, response = self._make_api_request(requests.get, url_path)
+    return json_result
+
+  @traced
   def get_widget_from_dash(self, name):
     slug = self.get_slug(name)
     url_path = "dashboards/{0}".format(slug)
@@ -22,3 +22,22 @@ class ChartType:
   SCATTER = "scatter"
   AREA = "area"
   allowed_chart_types = [BAR, PIE, LINE, SCATTER, AREA]
+
+
+class OversizedResult:
+  SPILL = "spill"
+  RAISE = "raise"
+  allowed_behaviors = [SPILL, RAISE]
+
+
+class RefreshMode:
+  BLOCKING = "blocking"
+  BACKGROUND = "background"
+  DEFERRED = "deferred"
+  allowed_refresh_modes = [BLOCKING, BACKGROUND, DEFERRED]
+
+
+class Routing:
+  WEIGHTED = "weighted"
+  LEAST_OUTSTANDING = "least_outstanding"
+  allowed_routings = [WEIGHTED, LEAST_OUTSTANDING]
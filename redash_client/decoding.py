@@ -0,0 +1,83 @@
+import json
+import multiprocessing
+
+
+class ColumnarRows(object):
+  # A read-only sequence of result rows stored as one list per column.
+  # Column names are kept once rather than in every row, which makes the
+  # result much cheaper to pass between processes. Rows are built as dicts
+  # only when they're read.
+
+  def __init__(self, column_names, columns):
+    self.column_names = column_names
+    self._columns = columns
+
+  def __len__(self):
+    return len(self._columns[0]) if self._columns else 0
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return [self[i] for i in range(*index.indices(len(self)))]
+    return dict(
+        (name, column[index])
+        for name, column in zip(self.column_names, self._columns))
+
+  def __iter__(self):
+    for values in zip(*self._columns):
+      yield dict(zip(self.column_names, values))
+
+  def __eq__(self, other):
+    return list(self) == list(other)
+
+  def __ne__(self, other):
+    return not self == other
+
+  def get_column(self, name):
+    return self._columns[self.column_names.index(name)]
+
+
+def decode_result(content):
+  # Parses a query_results response. Rows come back as ColumnarRows, with
+  # the columns in the order Redash lists them.
+  if isinstance(content, bytes):
+    content = content.decode("utf-8")
+  json_response = json.loads(content)
+
+  data = json_response.get("query_result", {}).get("data", None)
+  if not data or "rows" not in data:
+    return json_response
+
+  rows = data["rows"]
+  column_names = [column["name"] for column in data.get("columns", [])]
+  if not column_names and rows:
+    column_names = list(rows[0].keys())
+
+  data["rows"] = ColumnarRows(column_names, [
+      [row.get(name, None) for row in rows] for name in column_names])
+  return json_response
+
+
+class ResultDecoder(object):
+  # Decodes large query results on a pool of worker processes, so several
+  # results arriving at once are parsed in parallel instead of one after
+  # another under the GIL. Responses under min_bytes are decoded in the
+  # calling process, where it's cheaper than sending them to a worker.
+
+  def __init__(self, processes=None, min_bytes=1024 * 1024):
+    self.min_bytes = min_bytes
+    self._pool = multiprocessing.Pool(processes)
+
+  def decode(self, content):
+    if len(content) < self.min_bytes:
+      return decode_result(content)
+    return self._pool.apply(decode_result, (content,))
+
+  def close(self):
+    self._pool.terminate()
+    self._pool.join()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
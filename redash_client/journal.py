@@ -0,0 +1,126 @@
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class JobStatus:
+  # The job statuses Redash reports from jobs/<id>
+  PENDING = 1
+  STARTED = 2
+  SUCCESS = 3
+  FAILURE = 4
+  running_statuses = [PENDING, STARTED]
+
+
+def normalize_query(sql_query):
+  # Only whitespace and trailing semicolons are normalized: anything else
+  # could change what the query means (e.g. case inside string literals).
+  return WHITESPACE_PATTERN.sub(" ", sql_query).strip().rstrip(";").strip()
+
+
+def get_query_key(sql_query, data_source_id):
+  key = u"{0}:{1}".format(data_source_id, normalize_query(sql_query))
+  return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class JobJournal(object):
+  # A SQLite file recording the Redash jobs submitted for each query, so a
+  # process that was killed while polling can pick the job up again instead
+  # of running the same query twice. Entries older than max_age seconds are
+  # ignored, since Redash forgets about jobs after a while too.
+  #
+  # A job Redash has lost can look running forever: Celery reports unknown
+  # job ids as pending. So running entries are also ignored once their
+  # status hasn't changed for max_pending_age (pending) or max_started_age
+  # (started) seconds, and the query is submitted again.
+
+  def __init__(self, path, max_age=12 * 60 * 60, max_pending_age=15 * 60,
+               max_started_age=2 * 60 * 60):
+    self.path = path
+    self.max_age = max_age
+    self.max_pending_age = max_pending_age
+    self.max_started_age = max_started_age
+    self._lock = threading.Lock()
+    self._connection = sqlite3.connect(path, check_same_thread=False)
+    with self._lock, self._connection:
+      self._connection.execute("""
+          CREATE TABLE IF NOT EXISTS jobs (
+              query_key TEXT PRIMARY KEY,
+              data_source_id TEXT,
+              job_id TEXT,
+              status INTEGER,
+              query_result_id INTEGER,
+              submitted_at REAL,
+              updated_at REAL,
+              status_changed_at REAL
+          )""")
+      # Journals written before status_changed_at was added lack it.
+      columns = [column[1] for column in self._connection.execute(
+          "PRAGMA table_info(jobs)")]
+      if "status_changed_at" not in columns:
+        self._connection.execute(
+            "ALTER TABLE jobs ADD COLUMN status_changed_at REAL")
+
+  def _is_stalled(self, status, status_changed_at):
+    max_ages = {
+        JobStatus.PENDING: self.max_pending_age,
+        JobStatus.STARTED: self.max_started_age,
+    }
+    max_status_age = max_ages.get(status, None)
+    return (max_status_age is not None and
+            time.time() - status_changed_at > max_status_age)
+
+  def get(self, sql_query, data_source_id):
+    with self._lock:
+      row = self._connection.execute(
+          "SELECT job_id, status, query_result_id, submitted_at, updated_at, "
+          "COALESCE(status_changed_at, submitted_at) "
+          "FROM jobs WHERE query_key = ? AND submitted_at >= ?",
+          (get_query_key(sql_query, data_source_id),
+           time.time() - self.max_age)).fetchone()
+
+    if row is None or self._is_stalled(row[1], row[5]):
+      return None
+
+    return {
+        "job_id": row[0],
+        "status": row[1],
+        "query_result_id": row[2],
+        "submitted_at": row[3],
+        "updated_at": row[4],
+        "status_changed_at": row[5],
+    }
+
+  def record_submitted(self, sql_query, data_source_id, job_id,
+                       status=JobStatus.PENDING):
+    now = time.time()
+    with self._lock, self._connection:
+      self._connection.execute(
+          "INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, NULL, ?, ?, ?)",
+          (get_query_key(sql_query, data_source_id), str(data_source_id),
+           job_id, status, now, now, now))
+
+  def record_status(self, sql_query, data_source_id, status,
+                    query_result_id=None):
+    now = time.time()
+    with self._lock, self._connection:
+      self._connection.execute(
+          "UPDATE jobs SET status_changed_at = CASE WHEN status = ? "
+          "THEN COALESCE(status_changed_at, submitted_at) ELSE ? END, "
+          "status = ?, query_result_id = ?, updated_at = ? "
+          "WHERE query_key = ?",
+          (status, now, status, query_result_id, now,
+           get_query_key(sql_query, data_source_id)))
+
+  def remove(self, sql_query, data_source_id):
+    with self._lock, self._connection:
+      self._connection.execute(
+          "DELETE FROM jobs WHERE query_key = ?",
+          (get_query_key(sql_query, data_source_id),))
+
+  def close(self):
+    self._connection.close()
@@ -0,0 +1,472 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import bisect
+import threading
+import multiprocessing
+
+from redash_client.client import RedashClient
+from redash_client.constants import ChartType, VizType, VizWidth
+from redash_client.resilience import get_percentile
+
+try:
+  from http.server import BaseHTTPRequestHandler, HTTPServer
+  from socketserver import ThreadingMixIn
+except ImportError:  # pragma: no cover
+  from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+  from SocketServer import ThreadingMixIn
+
+DEFAULT_MIX = "query_results=6,search=3,dashboard=1"
+DEFAULT_CONCURRENCY = "1,2,4,8,16,32"
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+  # The default backlog of 5 refuses connections well before the client
+  # runs out of threads.
+  request_queue_size = 1024
+
+
+class _FakeRedashHandler(BaseHTTPRequestHandler):
+  # Answers just enough of the Redash API for the load test workloads,
+  # with made up ids and server.latency seconds of work per request.
+  protocol_version = "HTTP/1.1"
+
+  def setup(self):
+    BaseHTTPRequestHandler.setup(self)
+    counters = self.server.counters
+    with counters["lock"]:
+      counters["connections"].value += 1
+      counters["open_connections"].value += 1
+      counters["max_open_connections"].value = max(
+          counters["max_open_connections"].value,
+          counters["open_connections"].value)
+
+  def finish(self):
+    BaseHTTPRequestHandler.finish(self)
+    counters = self.server.counters
+    with counters["lock"]:
+      counters["open_connections"].value -= 1
+
+  def log_message(self, format, *args):
+    pass
+
+  def _get_next_id(self):
+    with self.server.id_lock:
+      self.server.last_id += 1
+      return self.server.last_id
+
+  def _send_json(self, json_response, status_code=200):
+    content = json.dumps(json_response).encode("utf-8")
+    self.send_response(status_code)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(content)))
+    self.end_headers()
+    self.wfile.write(content)
+
+  def _new_job(self):
+    job_id = self._get_next_id()
+    self.server.jobs[job_id] = time.time()
+    return {"job": {"id": job_id, "status": 1}}
+
+  def _get_job(self, job_id):
+    submitted_at = self.server.jobs.get(int(job_id), 0)
+    done = time.time() - submitted_at >= self.server.config["job_seconds"]
+    return {"job": {
+        "id": int(job_id),
+        "status": 3 if done else 2,
+        "query_result_id": int(job_id) if done else None,
+    }}
+
+  def _get_query_result(self, result_id):
+    rows = [
+        {"day": "2017-01-{0:02d}".format(i % 28 + 1), "count": i}
+        for i in range(self.server.config["result_rows"])
+    ]
+    return {"query_result": {"id": int(result_id), "data": {
+        "columns": [{"name": "day"}, {"name": "count"}],
+        "rows": rows,
+    }}}
+
+  def _get_query(self, query_id):
+    return {
+        "id": int(query_id),
+        "name": "Load test query {0}".format(query_id),
+        "query": "SELECT 1",
+        "data_source_id": 1,
+        "description": None,
+        "visualizations": [{"id": int(query_id), "type": "TABLE",
+                            "options": {}}],
+    }
+
+  def _route(self, method, path):
+    # Returns (json response, status code).
+    if method == "GET":
+      if re.match(r"^jobs/\d+$", path):
+        return self._get_job(path.split("/")[1]), 200
+      if re.match(r"^query_results/\d+$", path):
+        return self._get_query_result(path.split("/")[1]), 200
+      if path == "queries":
+        return {"results": [
+            self._get_query(query_id) for query_id in
+            range(1, self.server.config["search_results"] + 1)]}, 200
+      if re.match(r"^queries/\d+$", path):
+        return self._get_query(path.split("/")[1]), 200
+      if path.startswith("dashboards/"):
+        # Every dashboard the load test builds is a new one.
+        return {"message": "Not found"}, 404
+    elif method == "POST":
+      if path == "query_results":
+        return self._new_job(), 200
+      if path == "queries":
+        return self._get_query(self._get_next_id()), 200
+      if re.match(r"^queries/\d+/refresh$", path):
+        return self._new_job(), 200
+      if path == "dashboards":
+        dash_id = self._get_next_id()
+        return {"id": dash_id, "slug": "load-test-{0}".format(dash_id)}, 200
+      if path in ("visualizations", "widgets"):
+        return {"id": self._get_next_id()}, 200
+      if re.match(r"^dashboards/\d+$", path):
+        return {}, 200
+    return {"message": "Not found"}, 404
+
+  def _handle(self, method):
+    content_length = int(self.headers.get("Content-Length", 0) or 0)
+    if content_length:
+      self.rfile.read(content_length)
+
+    time.sleep(self.server.config["latency"])
+    path = self.path.split("?", 1)[0]
+    if path.startswith("/api/"):
+      path = path[len("/api/"):]
+    json_response, status_code = self._route(method, path.strip("/"))
+    self._send_json(json_response, status_code)
+
+  def do_GET(self):
+    self._handle("GET")
+
+  def do_POST(self):
+    self._handle("POST")
+
+
+def _serve(config, counters, port_queue):
+  server = _ThreadingHTTPServer(("127.0.0.1", 0), _FakeRedashHandler)
+  server.config = config
+  server.counters = counters
+  server.jobs = {}
+  server.last_id = 0
+  server.id_lock = threading.Lock()
+  port_queue.put(server.server_address[1])
+  server.serve_forever()
+
+
+class FakeRedashServer(object):
+  # A stand-in Redash server on localhost, run in its own process so its
+  # work doesn't count towards the CPU time of the client under test.
+  # latency is the seconds each request takes on the server and
+  # job_seconds how long a query runs before its result is ready.
+
+  def __init__(self, latency=0.005, job_seconds=0.0, result_rows=100,
+               search_results=5):
+    self._config = {
+        "latency": latency,
+        "job_seconds": job_seconds,
+        "result_rows": result_rows,
+        "search_results": search_results,
+    }
+    self._counters = {
+        "lock": multiprocessing.Lock(),
+        "connections": multiprocessing.Value("i", 0, lock=False),
+        "open_connections": multiprocessing.Value("i", 0, lock=False),
+        "max_open_connections": multiprocessing.Value("i", 0, lock=False),
+    }
+    self._process = None
+    self.url = None
+
+  def start(self):
+    port_queue = multiprocessing.Queue()
+    self._process = multiprocessing.Process(
+        target=_serve, args=(self._config, self._counters, port_queue))
+    self._process.daemon = True
+    self._process.start()
+    self.url = "http://127.0.0.1:{0}/".format(port_queue.get(timeout=10))
+
+  def stop(self):
+    if self._process is not None:
+      self._process.terminate()
+      self._process.join()
+      self._process = None
+
+  def __enter__(self):
+    self.start()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.stop()
+
+  def get_connection_counts(self):
+    # Returns (connections opened so far, most connections open at once)
+    # and starts counting the most open at once over again.
+    counters = self._counters
+    with counters["lock"]:
+      connection_counts = (
+          counters["connections"].value,
+          counters["max_open_connections"].value)
+      counters["max_open_connections"].value = (
+          counters["open_connections"].value)
+    return connection_counts
+
+
+def run_query_results(client):
+  client.get_query_results("SELECT day, count FROM load_test", 1)
+
+
+def run_search(client):
+  client.search_queries("load test")
+
+
+def run_dashboard(client):
+  # Builds a dashboard the way the experiment tooling does: two queries,
+  # a chart for one of them and both on the dashboard, then publishes it.
+  dash_info = client.create_new_dashboard(
+      "Load test {0}".format(random.randint(0, 1 << 30)))
+  visualizations = []
+  for name in ("Daily counts", "Counts table"):
+    query_id, table_id = client.create_new_query(name, "SELECT 1", 1)
+    visualizations.append((table_id, VizWidth.REGULAR))
+
+  chart_id = client.create_new_visualization(
+      query_id, VizType.CHART, "Counts", ChartType.LINE,
+      {"day": "x", "count": "y"})
+  visualizations.append((chart_id, VizWidth.WIDE))
+
+  client.add_visualizations_to_dashboard(
+      dash_info["dashboard_id"], visualizations)
+  client.publish_dashboard(dash_info["dashboard_id"])
+
+
+WORKLOADS = {
+    "query_results": run_query_results,
+    "search": run_search,
+    "dashboard": run_dashboard,
+}
+
+
+def parse_mix(mix):
+  # "query_results=6,search=3" -> [("query_results", 6), ("search", 3)]
+  weights = []
+  for item in mix.split(","):
+    name, _, weight = item.partition("=")
+    name = name.strip()
+    if name not in WORKLOADS:
+      raise ValueError("Unknown workload {0}, expected one of: {1}".format(
+          name, ", ".join(sorted(WORKLOADS))))
+    weights.append((name, float(weight or 1)))
+  return weights
+
+
+class StepResult(object):
+  # Measurements of one load test step, over every workload run in it.
+
+  def __init__(self, concurrency, seconds, latencies, errors, cpu_seconds,
+               connections, max_open_connections):
+    self.concurrency = concurrency
+    self.seconds = seconds
+    # workload name -> latencies in seconds of its successful runs
+    self.latencies = latencies
+    self.errors = errors
+    self.cpu_seconds = cpu_seconds
+    self.connections = connections
+    self.max_open_connections = max_open_connections
+
+  @property
+  def operations(self):
+    return sum(len(latencies) for latencies in self.latencies.values())
+
+  @property
+  def throughput(self):
+    return self.operations / self.seconds if self.seconds else 0.0
+
+  @property
+  def cpu_per_operation(self):
+    return self.cpu_seconds / self.operations if self.operations else None
+
+  def get_percentile(self, percentile, workload=None):
+    if workload is not None:
+      return get_percentile(self.latencies.get(workload, []), percentile)
+    return get_percentile(
+        [latency for latencies in self.latencies.values()
+         for latency in latencies], percentile)
+
+
+class LoadTest(object):
+  # Runs a mix of workloads against a FakeRedashServer from concurrency
+  # threads sharing one client, the way an application drives Redash from
+  # a single process. mix is a list of (workload name, weight), as
+  # parse_mix() returns, and defaults to DEFAULT_MIX.
+  # client_factory(base_url) makes the client under test.
+
+  def __init__(self, server, mix=None, client_factory=None, seed=None):
+    self._server = server
+    self._mix = mix or parse_mix(DEFAULT_MIX)
+    self._client_factory = client_factory or (
+        lambda base_url: RedashClient("load-test", base_url=base_url))
+    self._random = random.Random(seed)
+
+    self._cumulative_weights = []
+    total_weight = 0
+    for name, weight in self._mix:
+      total_weight += weight
+      self._cumulative_weights.append(total_weight)
+
+  def _choose_workload(self, worker_random):
+    point = worker_random.random() * self._cumulative_weights[-1]
+    index = bisect.bisect_right(self._cumulative_weights, point)
+    return self._mix[min(index, len(self._mix) - 1)][0]
+
+  def _run_worker(self, client, deadline, seed, latencies, errors, lock):
+    worker_random = random.Random(seed)
+    while time.time() < deadline:
+      workload = self._choose_workload(worker_random)
+      start_time = time.time()
+      try:
+        WORKLOADS[workload](client)
+      except Exception as e:
+        with lock:
+          errors.append((workload, str(e)))
+        continue
+
+      latency = time.time() - start_time
+      with lock:
+        latencies[workload].append(latency)
+
+  def run_step(self, concurrency, duration):
+    client = self._client_factory(self._server.url)
+    latencies = dict((name, []) for name, weight in self._mix)
+    errors = []
+    lock = threading.Lock()
+
+    start_connections, _ = self._server.get_connection_counts()
+    start_cpu = os.times()
+    start_time = time.time()
+    deadline = start_time + duration
+
+    workers = [
+        threading.Thread(target=self._run_worker, args=(
+            client, deadline, self._random.random(), latencies, errors,
+            lock))
+        for _ in range(concurrency)
+    ]
+    for worker in workers:
+      worker.daemon = True
+      worker.start()
+    for worker in workers:
+      worker.join()
+    try:
+      client.close()
+    except RedashClient.RedashClientException as e:
+      errors.append(("refresh", e.args[0]))
+
+    seconds = time.time() - start_time
+    end_cpu = os.times()
+    end_connections, max_open_connections = (
+        self._server.get_connection_counts())
+    cpu_seconds = (
+        (end_cpu[0] - start_cpu[0]) + (end_cpu[1] - start_cpu[1]))
+
+    return StepResult(
+        concurrency, seconds, latencies, errors, cpu_seconds,
+        end_connections - start_connections, max_open_connections)
+
+  def run(self, concurrency_steps, duration):
+    for concurrency in concurrency_steps:
+      yield self.run_step(concurrency, duration)
+
+
+RESULT_FORMAT = ("{0:>11} {1:>8} {2:>8} {3:>8} {4:>8} {5:>11} {6:>6} "
+                 "{7:>11} {8:>8}")
+RESULT_HEADER = RESULT_FORMAT.format(
+    "concurrency", "ops/s", "p50 ms", "p95 ms", "p99 ms", "cpu ms/op",
+    "errors", "connections", "max open")
+
+
+def _format_milliseconds(seconds):
+  return "-" if seconds is None else "{0:.1f}".format(seconds * 1000)
+
+
+def format_step_result(step_result):
+  return RESULT_FORMAT.format(
+      step_result.concurrency,
+      "{0:.1f}".format(step_result.throughput),
+      _format_milliseconds(step_result.get_percentile(50)),
+      _format_milliseconds(step_result.get_percentile(95)),
+      _format_milliseconds(step_result.get_percentile(99)),
+      _format_milliseconds(step_result.cpu_per_operation),
+      len(step_result.errors),
+      step_result.connections,
+      step_result.max_open_connections)
+
+
+def get_argument_parser():
+  parser = argparse.ArgumentParser(
+      prog="python -m redash_client.loadtest",
+      description=("Drive a local stand-in Redash server with a mix of "
+                   "client workloads at increasing concurrency."))
+  parser.add_argument(
+      "-c", "--concurrency", default=DEFAULT_CONCURRENCY,
+      help="comma separated thread counts to step through "
+           "(default: {0})".format(DEFAULT_CONCURRENCY))
+  parser.add_argument(
+      "-d", "--duration", type=float, default=5.0,
+      help="seconds to run each step for (default: 5)")
+  parser.add_argument(
+      "-m", "--mix", default=DEFAULT_MIX,
+      help="workload weights, from {0} (default: {1})".format(
+          ", ".join(sorted(WORKLOADS)), DEFAULT_MIX))
+  parser.add_argument(
+      "--latency", type=float, default=0.005,
+      help="seconds the server takes per request (default: 0.005)")
+  parser.add_argument(
+      "--job-seconds", type=float, default=0.0,
+      help="seconds before a query's result is ready (default: 0)")
+  parser.add_argument(
+      "--rows", type=int, default=100,
+      help="rows in every query result (default: 100)")
+  return parser
+
+
+def main(argv=None):
+  parser = get_argument_parser()
+  args = parser.parse_args(argv)
+  try:
+    concurrency_steps = [int(step) for step in args.concurrency.split(",")]
+    load_test_mix = parse_mix(args.mix)
+  except ValueError as e:
+    parser.error(str(e))
+  if min(concurrency_steps) < 1:
+    parser.error("--concurrency steps must be at least 1")
+
+  # RedashClient logs every dashboard it creates.
+  logging.disable(logging.INFO)
+  server = FakeRedashServer(
+      latency=args.latency, job_seconds=args.job_seconds,
+      result_rows=args.rows)
+  with server:
+    load_test = LoadTest(server, mix=load_test_mix)
+    print("Mix: {0}".format(", ".join(
+        "{0}={1:g}".format(name, weight) for name, weight in load_test_mix)))
+    print(RESULT_HEADER)
+    for step_result in load_test.run(concurrency_steps, args.duration):
+      print(format_step_result(step_result))
+      sys.stdout.flush()
+  return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+  sys.exit(main())
@@ -0,0 +1,56 @@
+import re
+import datetime
+
+PARAMETER_PATTERN = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+def render_sql_template(sql_template, parameters):
+  # Templates use Redash's own {{ parameter }} syntax so the same SQL can be
+  # pasted into the Redash editor while it's being developed.
+  def substitute(match):
+    name = match.group(1)
+    if name not in parameters:
+      raise KeyError(
+          "No value for template parameter: {0}".format(name))
+    return str(parameters[name])
+
+  return PARAMETER_PATTERN.sub(substitute, sql_template)
+
+
+def date_partitions(start_date, end_date, days=1,
+                    start_key="start_date", end_key="end_date",
+                    date_format="%Y-%m-%d"):
+  # Split [start_date, end_date) into consecutive ranges of `days` days.
+  # The last range is truncated so it never goes past end_date.
+  if days < 1:
+    raise ValueError("days must be at least 1")
+
+  partitions = []
+  step = datetime.timedelta(days=days)
+  current = start_date
+  while current < end_date:
+    upper = min(current + step, end_date)
+    partitions.append({
+        start_key: current.strftime(date_format),
+        end_key: upper.strftime(date_format),
+    })
+    current = upper
+
+  return partitions
+
+
+def key_partitions(lower_bound, upper_bound, step,
+                   lower_key="lower_key", upper_key="upper_key"):
+  # Split the integer key range [lower_bound, upper_bound) into
+  # consecutive ranges of at most `step` keys.
+  if step < 1:
+    raise ValueError("step must be at least 1")
+
+  partitions = []
+  current = lower_bound
+  while current < upper_bound:
+    upper = min(current + step, upper_bound)
+    partitions.append({lower_key: current, upper_key: upper})
+    current = upper
+
+  return partitions
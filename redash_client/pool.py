@@ -0,0 +1,145 @@
+import time
+import random
+import functools
+import threading
+
+from redash_client.client import RedashClient
+from redash_client.constants import Routing
+from redash_client.resilience import CircuitBreaker, is_transient_error
+
+
+def is_failover_error(exception):
+  # An open circuit breaker means the instance is known to be unhealthy.
+  if is_transient_error(exception):
+    return True
+  return any(isinstance(cause, CircuitBreaker) for cause in exception.args)
+
+
+class PoolEndpoint(object):
+
+  def __init__(self, client, weight=1):
+    self.client = client
+    self.weight = weight
+    self.outstanding = 0
+    self.unavailable_until = 0
+
+  @property
+  def is_available(self):
+    return time.time() >= self.unavailable_until
+
+
+class RedashClientPool(object):
+  # Spreads read-only calls over several Redash instances (e.g. read
+  # replicas) while every other call goes to the primary. A read that fails
+  # with a connection error or gateway status is retried on the next
+  # instance, and the failed one is skipped for FAILURE_COOLDOWN seconds.
+  # Reads refused by an instance's open circuit breaker fail over too.
+  #
+  # Note: replicas is a list of RedashClients, or of (RedashClient, weight)
+  # pairs, each created with its own base_url and api_key. The primary only
+  # serves reads when primary_weight is above 0 or every replica has failed.
+  READ_METHODS = (
+      "get_dashboard",
+      "get_dashboards",
+      "get_data_sources",
+      "get_queries",
+      "get_query",
+      "get_query_result",
+      "get_query_results",
+      "get_schema_index",
+      "get_widget_from_dash",
+      "search_queries",
+  )
+  FAILURE_COOLDOWN = 30
+
+  def __init__(self, primary, replicas=(), routing=Routing.LEAST_OUTSTANDING,
+               primary_weight=0):
+    if routing not in Routing.allowed_routings:
+      raise ValueError(("routing should be one of "
+                        "Routing.WEIGHTED or Routing.LEAST_OUTSTANDING"))
+
+    self.primary = primary
+    self._routing = routing
+    self._lock = threading.Lock()
+
+    self._primary_endpoint = PoolEndpoint(primary, primary_weight)
+    self._endpoints = [self._primary_endpoint]
+    for replica in replicas:
+      if isinstance(replica, RedashClient):
+        replica = (replica,)
+      self._endpoints.append(PoolEndpoint(*replica))
+
+  def __getattr__(self, name):
+    if name in self.READ_METHODS:
+      return functools.partial(self._call_read_method, name)
+    return getattr(self.primary, name)
+
+  def _pick_endpoint(self, endpoints):
+    if self._routing == Routing.LEAST_OUTSTANDING:
+      lowest_load = min(
+          float(endpoint.outstanding) / endpoint.weight
+          for endpoint in endpoints)
+      endpoints = [
+          endpoint for endpoint in endpoints
+          if float(endpoint.outstanding) / endpoint.weight == lowest_load
+      ]
+
+    point = random.uniform(0, sum(endpoint.weight for endpoint in endpoints))
+    for endpoint in endpoints:
+      point -= endpoint.weight
+      if point <= 0:
+        return endpoint
+    return endpoints[-1]
+
+  def _get_endpoint_order(self):
+    # Routed endpoints first, then failed ones in case they have recovered,
+    # and the primary last unless it's routed to as well.
+    weighted = [endpoint for endpoint in self._endpoints if endpoint.weight]
+    available = [endpoint for endpoint in weighted if endpoint.is_available]
+
+    order = []
+    while available:
+      endpoint = self._pick_endpoint(available)
+      available.remove(endpoint)
+      order.append(endpoint)
+
+    order.extend(
+        endpoint for endpoint in weighted if endpoint not in order)
+    if self._primary_endpoint not in order:
+      order.append(self._primary_endpoint)
+    return order
+
+  def _call_read_method(self, name, *args, **kwargs):
+    with self._lock:
+      endpoints = self._get_endpoint_order()
+      endpoints[0].outstanding += 1
+
+    last_error = None
+    for index, endpoint in enumerate(endpoints):
+      if index:
+        with self._lock:
+          endpoint.outstanding += 1
+
+      try:
+        return getattr(endpoint.client, name)(*args, **kwargs)
+      except RedashClient.RedashClientException as e:
+        if not is_failover_error(e):
+          raise
+
+        last_error = e
+        endpoint.unavailable_until = time.time() + self.FAILURE_COOLDOWN
+        endpoint.client._logger.info((
+            "RedashClientPool: {url} failed, trying the next instance: "
+            "{error}").format(url=endpoint.client.BASE_URL, error=e.args[0]))
+      finally:
+        with self._lock:
+          endpoint.outstanding -= 1
+
+    raise last_error
+
+  def get_outstanding_requests(self):
+    # Returns {base_url: outstanding read calls}, for monitoring.
+    with self._lock:
+      return dict(
+          (endpoint.client.BASE_URL, endpoint.outstanding)
+          for endpoint in self._endpoints)
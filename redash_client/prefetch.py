@@ -0,0 +1,174 @@
+import logging
+import threading
+from collections import OrderedDict
+
+from redash_client.utils import get_widget_query, map_concurrently
+
+
+class DashboardPrefetcher(object):
+  # Keeps the latest results of the queries shown on a few dashboards in
+  # memory, so they can be read without calling Redash. A background thread
+  # refreshes them every interval seconds; a result is only fetched again
+  # when its query has a newer one.
+  #
+  # By default the cache holds one result per query on the dashboards and
+  # drops the results of queries no longer shown. max_entries caps it
+  # further, dropping the least recently used results first; note that a
+  # result dropped this way is fetched again on every refresh, so a cap
+  # below the number of queries costs that many requests per interval.
+
+  def __init__(self, client, dashboard_names, interval=300, max_entries=None,
+               max_workers=4):
+    self._client = client
+    self._dashboard_names = list(dashboard_names)
+    self._interval = interval
+    self._max_entries = max_entries
+    self._max_workers = max_workers
+    self._logger = logging.getLogger(__name__)
+
+    # query id -> (query result id, query result)
+    self._results = OrderedDict()
+    # dashboard name -> query ids of its widgets, in widget order
+    self._dashboard_queries = {}
+    self._lock = threading.Lock()
+    self._stopped = threading.Event()
+    self._thread = None
+
+  def __len__(self):
+    return len(self._results)
+
+  def _get_dashboard_queries(self, name):
+    # Returns (name, None) if the dashboard can't be read, so that the
+    # others are still refreshed.
+    queries = []
+    try:
+      widgets = self._client.get_widget_from_dash(name)
+    except self._client.RedashClientException as e:
+      self._logger.warning((
+          "DashboardPrefetcher: Unable to read dashboard {name}: "
+          "{error}").format(name=name, error=e.args[0]))
+      return name, None
+
+    for widget in widgets:
+      query = get_widget_query(widget)
+      if query is not None:
+        queries.append(query)
+    return name, queries
+
+  def _fetch_result(self, fetch_args):
+    query_id, result_id = fetch_args
+    try:
+      return query_id, result_id, self._client.get_query_result(result_id)
+    except self._client.RedashClientException as e:
+      self._logger.warning((
+          "DashboardPrefetcher: Unable to fetch result {result_id} of query "
+          "{query_id}: {error}").format(
+              result_id=result_id, query_id=query_id, error=e.args[0]))
+      return query_id, result_id, None
+
+  def _store(self, query_id, result_id, result):
+    # Called with the lock held.
+    self._results.pop(query_id, None)
+    self._results[query_id] = (result_id, result)
+    if self._max_entries is None:
+      return
+    while len(self._results) > self._max_entries:
+      self._results.popitem(last=False)
+
+  def refresh(self):
+    # Fetches every result that changed since the previous refresh and
+    # returns how many were fetched. Runs in the calling thread; start()
+    # calls it on a schedule.
+    dashboard_queries = map_concurrently(
+        self._get_dashboard_queries, self._dashboard_names,
+        self._max_workers)
+
+    latest_result_ids = OrderedDict()
+    for name, queries in dashboard_queries:
+      for query in queries or []:
+        result_id = query.get("latest_query_data_id", None)
+        if result_id is not None:
+          latest_result_ids[query["id"]] = result_id
+
+    with self._lock:
+      # A dashboard that couldn't be read keeps its previous queries.
+      self._dashboard_queries.update(
+          (name, [query["id"] for query in queries])
+          for name, queries in dashboard_queries if queries is not None)
+      shown_query_ids = set(
+          query_id for query_ids in self._dashboard_queries.values()
+          for query_id in query_ids)
+      for query_id in list(self._results):
+        if query_id not in shown_query_ids:
+          del self._results[query_id]
+
+      stale_results = [
+          (query_id, result_id)
+          for query_id, result_id in latest_result_ids.items()
+          if self._results.get(query_id, (None, None))[0] != result_id
+      ]
+
+    fetched_results = [
+        fetched_result
+        for fetched_result in map_concurrently(
+            self._fetch_result, stale_results, self._max_workers)
+        if fetched_result[2] is not None
+    ]
+    with self._lock:
+      for query_id, result_id, result in fetched_results:
+        self._store(query_id, result_id, result)
+    return len(fetched_results)
+
+  def get(self, query_id):
+    # Returns the cached result of a query (as get_query_result() does), or
+    # None if it hasn't been fetched.
+    with self._lock:
+      if query_id not in self._results:
+        return None
+      result_id, result = self._results.pop(query_id)
+      self._results[query_id] = (result_id, result)
+      return result
+
+  def get_dashboard_results(self, name):
+    # Returns {query id: result} for the cached results of a dashboard's
+    # widgets.
+    with self._lock:
+      query_ids = self._dashboard_queries.get(name, [])
+    dashboard_results = {}
+    for query_id in query_ids:
+      result = self.get(query_id)
+      if result is not None:
+        dashboard_results[query_id] = result
+    return dashboard_results
+
+  def _run(self, delay):
+    while not self._stopped.wait(delay):
+      try:
+        self.refresh()
+      except Exception:
+        # The schedule must survive a failed refresh, e.g. while Redash is
+        # down; the results already cached remain readable.
+        self._logger.exception("DashboardPrefetcher: Refresh failed")
+      delay = self._interval
+
+  def start(self, wait=False):
+    # With wait, the first refresh runs before start() returns, so the
+    # cache is warm as soon as the application starts serving.
+    if self._thread is not None:
+      return
+    delay = 0
+    if wait:
+      self.refresh()
+      delay = self._interval
+
+    self._stopped.clear()
+    self._thread = threading.Thread(target=self._run, args=(delay,))
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    if self._thread is None:
+      return
+    self._stopped.set()
+    self._thread.join()
+    self._thread = None
@@ -0,0 +1,88 @@
+import time
+import requests
+import threading
+from collections import deque
+
+# Failing with one of these means the server, not the request, is at fault,
+# so the same request is worth sending again, possibly somewhere else.
+TRANSIENT_STATUS_CODES = (502, 503, 504)
+TRANSIENT_EXCEPTIONS = (requests.ConnectionError, requests.Timeout)
+
+
+def get_percentile(latencies, percentile):
+  # Nearest-rank percentile of latencies, or None if there are none.
+  if not latencies:
+    return None
+  latencies = sorted(latencies)
+  index = int(round(percentile / 100.0 * (len(latencies) - 1)))
+  return latencies[index]
+
+
+def is_transient_error(exception):
+  # Takes a RedashClientException, whose second argument is the underlying
+  # requests exception or the HTTP status code.
+  if len(exception.args) < 2:
+    return False
+
+  cause = exception.args[1]
+  return (isinstance(cause, TRANSIENT_EXCEPTIONS) or
+          cause in TRANSIENT_STATUS_CODES)
+
+
+class CircuitBreaker(object):
+  # Stops requests to a server after failure_threshold failures in a row.
+  # Once reset_timeout seconds have passed a single trial request is let
+  # through: if it succeeds requests flow again, otherwise the wait restarts.
+  CLOSED = "closed"
+  OPEN = "open"
+  HALF_OPEN = "half_open"
+
+  def __init__(self, failure_threshold=5, reset_timeout=30):
+    self.failure_threshold = failure_threshold
+    self.reset_timeout = reset_timeout
+    self.state = self.CLOSED
+    self._failure_count = 0
+    self._opened_at = None
+    self._lock = threading.Lock()
+
+  def allow_request(self):
+    with self._lock:
+      if self.state == self.CLOSED:
+        return True
+
+      waited_long_enough = time.time() - self._opened_at >= self.reset_timeout
+      if self.state == self.OPEN and waited_long_enough:
+        self.state = self.HALF_OPEN
+        return True
+      return False
+
+  def record_success(self):
+    with self._lock:
+      self.state = self.CLOSED
+      self._failure_count = 0
+
+  def record_failure(self):
+    with self._lock:
+      self._failure_count += 1
+      if (self.state == self.HALF_OPEN or
+         self._failure_count >= self.failure_threshold):
+        self.state = self.OPEN
+        self._opened_at = time.time()
+
+
+class LatencyTracker(object):
+  # Keeps the latencies of the last window_size requests.
+  MIN_SAMPLE_COUNT = 20
+
+  def __init__(self, window_size=200):
+    self._latencies = deque(maxlen=window_size)
+
+  def record(self, seconds):
+    self._latencies.append(seconds)
+
+  def get_percentile(self, percentile):
+    # Returns None until there are enough samples to go on.
+    latencies = list(self._latencies)
+    if len(latencies) < self.MIN_SAMPLE_COUNT:
+      return None
+    return get_percentile(latencies, percentile)
@@ -0,0 +1,201 @@
+import os
+import json
+import codecs
+import tempfile
+
+READ_CHUNK_BYTES = 64 * 1024
+WHITESPACE = " \t\n\r"
+VALUE_DELIMITERS = WHITESPACE + ",:]}"
+
+# Where the rows are in a query_results response.
+ROWS_PATH = ("query_result", "data", "rows")
+
+
+def get_result_stats(rows, byte_count):
+  return {
+      "rows": len(rows),
+      "bytes": byte_count,
+      "spilled": False,
+  }
+
+
+def write_json(value, output_file, path=()):
+  # Writes value to output_file as json.dump() would, except that the rows
+  # found by following the keys of path are written one at a time, so they
+  # can be any iterable of rows, e.g. a SpilledRows, and never have to be
+  # in memory as a whole.
+  if isinstance(value, dict) and path and path[0] in value:
+    output_file.write("{")
+    for index, (key, item) in enumerate(value.items()):
+      if index:
+        output_file.write(", ")
+      output_file.write(json.dumps(key))
+      output_file.write(": ")
+      if key == path[0]:
+        write_json(item, output_file, path[1:])
+      else:
+        output_file.write(json.dumps(item))
+    output_file.write("}")
+  elif not path and value is not None and not isinstance(value, dict):
+    output_file.write("[")
+    for index, row in enumerate(value):
+      if index:
+        output_file.write(", ")
+      output_file.write(json.dumps(row))
+    output_file.write("]")
+  else:
+    output_file.write(json.dumps(value))
+
+
+class SpilledRows(object):
+  # A read-only sequence of result rows kept in a temporary file on disk,
+  # one JSON object per line. Rows are written as they're read from rows,
+  # and only decoded again while iterating, so an oversized result never
+  # has to be in memory as a whole.
+
+  def __init__(self, rows, stats, directory=None):
+    file_descriptor, self._path = tempfile.mkstemp(
+        prefix="redash_result_", suffix=".ndjson", dir=directory)
+    row_count = 0
+    try:
+      with os.fdopen(file_descriptor, "w") as spill_file:
+        for row in rows:
+          spill_file.write(json.dumps(row))
+          spill_file.write("\n")
+          row_count += 1
+    except Exception:
+      self.close()
+      raise
+
+    self.stats = dict(stats, rows=row_count, spilled=True, path=self._path)
+
+  def __len__(self):
+    return self.stats["rows"]
+
+  def __iter__(self):
+    if self._path is None:
+      raise ValueError("Spilled result has already been closed")
+
+    with open(self._path) as spill_file:
+      for line in spill_file:
+        yield json.loads(line)
+
+  def close(self):
+    if self._path is not None and os.path.exists(self._path):
+      os.remove(self._path)
+    self._path = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def __del__(self):
+    self.close()
+
+
+class StreamedResult(object):
+  # Parses a query_results response from a file one row at a time. Rows are
+  # yielded by iter_rows(); everything else is decoded whole and can be
+  # read from json_response once the rows are exhausted, with an empty
+  # list in place of the rows.
+
+  def __init__(self, result_file):
+    self._file = result_file
+    self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+    self._json_decoder = json.JSONDecoder()
+    self._buffer = ""
+    self._position = 0
+    self._at_end = False
+    self.json_response = None
+
+  def _fill(self):
+    # Returns False once the file is exhausted.
+    if self._at_end:
+      return False
+
+    chunk = self._file.read(READ_CHUNK_BYTES)
+    self._at_end = not chunk
+    self._buffer = self._buffer[self._position:] + self._text_decoder.decode(
+        chunk, final=self._at_end)
+    self._position = 0
+    return True
+
+  def _peek(self):
+    while True:
+      while (self._position < len(self._buffer) and
+             self._buffer[self._position] in WHITESPACE):
+        self._position += 1
+      if self._position < len(self._buffer):
+        return self._buffer[self._position]
+      if not self._fill():
+        return None
+
+  def _expect(self, characters):
+    character = self._peek()
+    if character is None or character not in characters:
+      raise ValueError("Expected one of {0!r} in result, found {1!r}".format(
+          characters, character))
+    self._position += 1
+    return character
+
+  def _read_value(self):
+    self._peek()
+    while True:
+      try:
+        value, end = self._json_decoder.raw_decode(
+            self._buffer, self._position)
+        # A number cut short by the end of the buffer, e.g. "10." of
+        # "10.5", still decodes: only a delimiter shows it's complete.
+        complete = (end < len(self._buffer) and
+                    self._buffer[end] in VALUE_DELIMITERS)
+        if complete or not self._fill():
+          self._position = end
+          return value
+      except ValueError:
+        if not self._fill():
+          raise
+
+  def _iter_object(self, json_object, path):
+    # Reads an object into json_object, descending into path.
+    self._expect("{")
+    if self._peek() == "}":
+      self._position += 1
+      return
+
+    while True:
+      key = self._read_value()
+      self._expect(":")
+      if path and key == path[0] and len(path) == 1 and self._peek() == "[":
+        json_object[key] = []
+        for row in self._iter_array():
+          yield row
+      elif path and key == path[0] and len(path) > 1 and self._peek() == "{":
+        json_object[key] = {}
+        for row in self._iter_object(json_object[key], path[1:]):
+          yield row
+      else:
+        json_object[key] = self._read_value()
+
+      if self._expect(",}") == "}":
+        return
+
+  def _iter_array(self):
+    self._expect("[")
+    if self._peek() == "]":
+      self._position += 1
+      return
+
+    while True:
+      yield self._read_value()
+      if self._expect(",]") == "]":
+        return
+
+  def iter_rows(self):
+    json_response = {}
+    for row in self._iter_object(json_response, ROWS_PATH):
+      yield row
+    if self._peek() is not None:
+      raise ValueError("Unexpected data after the result")
+    self.json_response = json_response
@@ -0,0 +1,162 @@
+import re
+import time
+
+COMMENT_PATTERN = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+STRING_PATTERN = re.compile(r"'(?:[^']|'')*'")
+TOKEN_PATTERN = re.compile(
+    r'[A-Za-z_][\w$]*|`[^`]*`|"[^"]*"|\[[^\]]*\]|[().,]|\S')
+
+# Functions whose arguments can contain FROM without it naming a table,
+# e.g. EXTRACT(day FROM submission_date).
+FROM_ARGUMENT_FUNCTIONS = ("extract", "substring", "trim", "position",
+                           "overlay")
+
+
+def _unquote(identifier):
+  if identifier[:1] in ('`', '"', '['):
+    return identifier[1:-1]
+  return identifier
+
+
+def _is_identifier(token):
+  return token[:1].isalpha() or token[:1] in ('_', '`', '"', '[')
+
+
+def find_table_references(sql_query):
+  # A deliberately small scanner rather than a SQL parser: it finds the
+  # names that follow FROM and JOIN, skipping subqueries, table functions
+  # and the names of common table expressions defined in the same query.
+  sql_query = COMMENT_PATTERN.sub(" ", sql_query)
+  sql_query = STRING_PATTERN.sub("''", sql_query)
+  tokens = TOKEN_PATTERN.findall(sql_query)
+
+  cte_names = set()
+  for index, token in enumerate(tokens):
+    if not _is_identifier(token):
+      continue
+    position = index + 1
+    # The CTE may name its columns: name (a, b) AS (...).
+    if position < len(tokens) and tokens[position] == "(":
+      position += 1
+      while (position < len(tokens) and
+             (_is_identifier(tokens[position]) or tokens[position] == ",")):
+        position += 1
+      if position >= len(tokens) or tokens[position] != ")":
+        continue
+      position += 1
+    following = [next_token.lower()
+                 for next_token in tokens[position:position + 2]]
+    if following == ["as", "("]:
+      cte_names.add(_unquote(token).lower())
+
+  references = []
+  open_functions = []
+  for index, token in enumerate(tokens):
+    if token == "(":
+      previous = tokens[index - 1].lower() if index else None
+      open_functions.append(previous)
+      continue
+    if token == ")":
+      if open_functions:
+        open_functions.pop()
+      continue
+
+    if token.lower() not in ("from", "join"):
+      continue
+    if open_functions and open_functions[-1] in FROM_ARGUMENT_FUNCTIONS:
+      continue
+    # a IS [NOT] DISTINCT FROM b compares values.
+    if index and tokens[index - 1].lower() == "distinct":
+      continue
+
+    parts = []
+    position = index + 1
+    while position < len(tokens) and _is_identifier(tokens[position]):
+      parts.append(_unquote(tokens[position]))
+      if position + 1 < len(tokens) and tokens[position + 1] == ".":
+        position += 2
+      else:
+        position += 1
+        break
+
+    is_function = position < len(tokens) and tokens[position] == "("
+    if not parts or is_function:
+      continue
+
+    table_name = ".".join(parts)
+    if table_name.lower() not in cte_names and table_name not in references:
+      references.append(table_name)
+
+  return references
+
+
+class SchemaIndex(object):
+  # Table and column names of one data source, lowercased for lookup.
+  # Tables can be looked up fully qualified or by their last name component.
+  #
+  # unavailable_reason is set when the data source gave no schema to go on,
+  # e.g. because it doesn't support schemas; such an index has no tables.
+
+  def __init__(self, tables, fetched_at=None, unavailable_reason=None):
+    self.fetched_at = time.time() if fetched_at is None else fetched_at
+    self.unavailable_reason = unavailable_reason
+    self._tables = {}
+    self._unqualified_tables = {}
+
+    for table_name, columns in tables.items():
+      table_name = table_name.lower()
+      columns = set(column.lower() for column in columns)
+      self._tables[table_name] = columns
+      self._unqualified_tables.setdefault(
+          table_name.split(".")[-1], set()).update(columns)
+
+  @classmethod
+  def from_schema_response(cls, schema_response):
+    # Older Redash versions return the table list itself, newer ones wrap it
+    # in {"schema": [...]}. Columns are names or {"name": ...} objects.
+    #
+    # Data sources without schema support answer {"error": {...}}, and newer
+    # Redash versions answer {"job": {...}} while the schema isn't cached
+    # yet. Both give an unavailable index.
+    if isinstance(schema_response, dict):
+      if "schema" not in schema_response:
+        if "job" in schema_response:
+          reason = "the schema is still being fetched"
+        else:
+          error = schema_response.get("error", None)
+          if isinstance(error, dict):
+            error = error.get("message", None)
+          reason = error or "the response has no schema"
+        return cls({}, unavailable_reason=reason)
+      schema_response = schema_response["schema"]
+
+    tables = {}
+    for table in schema_response:
+      tables[table["name"]] = [
+          column["name"] if isinstance(column, dict) else column
+          for column in table.get("columns", [])
+      ]
+    return cls(tables)
+
+  def __len__(self):
+    return len(self._tables)
+
+  @property
+  def is_available(self):
+    return self.unavailable_reason is None
+
+  def is_expired(self, ttl):
+    return time.time() - self.fetched_at > ttl
+
+  def get_columns(self, table_name):
+    table_name = table_name.lower()
+    if table_name in self._tables:
+      return self._tables[table_name]
+    return self._unqualified_tables.get(table_name.split(".")[-1], None)
+
+  def has_table(self, table_name):
+    return self.get_columns(table_name) is not None
+
+  def has_column(self, table_name, column_name):
+    columns = self.get_columns(table_name)
+    return columns is not None and column_name.lower() in columns
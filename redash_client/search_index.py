@@ -0,0 +1,147 @@
+import re
+import threading
+
+from redash_client.utils import get_all_pages, map_concurrently
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+INDEXED_FIELDS = ("name", "description", "query")
+
+# Taking into account different versions of Python
+try:  # pragma: no cover
+  STRING_TYPES = (str, unicode)
+except NameError:  # pragma: no cover
+  STRING_TYPES = (str,)
+
+
+def tokenize(text):
+  return set(token.lower() for token in TOKEN_PATTERN.findall(text or ""))
+
+
+class QueryIndex(object):
+  # A local copy of every query on the server, kept in the same form
+  # RedashClient.search_queries() returns, with an inverted index over the
+  # words of each query's name, description and SQL.
+  #
+  # sync() lists queries most recently updated first and stops at the first
+  # one that hasn't changed since the previous sync, so keeping the index
+  # current costs a request or two. Deleted queries only disappear on a
+  # full sync.
+  PAGE_SIZE = 250
+
+  def __init__(self, client, include_visualizations=True, max_workers=8):
+    self._client = client
+    self._include_visualizations = include_visualizations
+    self._max_workers = max_workers
+
+    self._queries = {}
+    self._query_tokens = {}
+    self._token_queries = {}
+    self._synced_until = None
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return len(self._queries)
+
+  def _get_recently_updated_queries(self, page, page_size):
+    return self._client.get_queries(page, page_size, order="-updated_at")
+
+  def _get_changed_queries(self, synced_until):
+    changed_queries = {}
+    queries = get_all_pages(
+        self._get_recently_updated_queries, self.PAGE_SIZE)
+    for query in queries:
+      # Queries updated at the previous sync's last timestamp are fetched
+      # again, since others may have been saved within the same instant.
+      if synced_until and query.get("updated_at", "") < synced_until:
+        break
+      changed_queries.setdefault(query["id"], query)
+    return list(changed_queries.values())
+
+  def _get_visualization(self, query_id):
+    return self._client._get_visualization(query_id)
+
+  def _add(self, template):
+    self._remove(template["id"])
+
+    tokens = set()
+    for field in INDEXED_FIELDS:
+      tokens.update(tokenize(template[field]))
+
+    self._queries[template["id"]] = template
+    self._query_tokens[template["id"]] = tokens
+    for token in tokens:
+      self._token_queries.setdefault(token, set()).add(template["id"])
+
+  def _remove(self, query_id):
+    for token in self._query_tokens.pop(query_id, ()):
+      query_ids = self._token_queries[token]
+      query_ids.discard(query_id)
+      if not query_ids:
+        del self._token_queries[token]
+    self._queries.pop(query_id, None)
+
+  def sync(self, full=False):
+    # Returns the number of queries added or updated.
+    synced_until = None if full else self._synced_until
+    changed_queries = self._get_changed_queries(synced_until)
+
+    visualizations = [None] * len(changed_queries)
+    if self._include_visualizations:
+      visualizations = map_concurrently(
+          self._get_visualization,
+          [query["id"] for query in changed_queries], self._max_workers)
+
+    with self._lock:
+      if full:
+        self._queries = {}
+        self._query_tokens = {}
+        self._token_queries = {}
+
+      for query, visualization in zip(changed_queries, visualizations):
+        template = self._client._make_query_template(query, visualization)
+        template["updated_at"] = query.get("updated_at", None)
+        self._add(template)
+
+      updated_at = [
+          query["updated_at"] for query in changed_queries
+          if query.get("updated_at", None)
+      ]
+      if updated_at:
+        self._synced_until = max([self._synced_until or ""] + updated_at)
+
+    return len(changed_queries)
+
+  def get(self, query_id):
+    return self._queries.get(query_id, None)
+
+  def search(self, keyword=None, **fields):
+    # Note: keyword matches queries containing every word of it in their
+    # name, description or SQL. fields are matched against the query
+    # template: strings as case-insensitive substrings, anything else by
+    # equality, e.g. search("retention", data_source_id=5, type="CHART").
+    with self._lock:
+      if keyword:
+        query_ids = None
+        for token in tokenize(keyword):
+          matches = self._token_queries.get(token, set())
+          query_ids = matches if query_ids is None else query_ids & matches
+        query_ids = query_ids or set()
+      else:
+        query_ids = self._queries.keys()
+
+      templates = [self._queries[query_id] for query_id in query_ids]
+
+    for field, value in fields.items():
+      if isinstance(value, STRING_TYPES):
+        value = value.lower()
+        templates = [
+            template for template in templates
+            if value in (template.get(field, None) or "").lower()
+        ]
+      else:
+        templates = [
+            template for template in templates
+            if template.get(field, None) == value
+        ]
+
+    return sorted(templates, key=lambda template: template["id"])
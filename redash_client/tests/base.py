@@ -3,10 +3,30 @@ import unittest
 
 
 class AppTest(unittest.TestCase):
+  # Maintain python2 compatibility
+  if not hasattr(unittest.TestCase, "assertCountEqual"):  # pragma: no cover
+    assertCountEqual = unittest.TestCase.assertItemsEqual
+  if not hasattr(unittest.TestCase, "assertRaisesRegex"):  # pragma: no cover
+    assertRaisesRegex = unittest.TestCase.assertRaisesRegexp
+
+  def patch_methods(self, target, side_effects):
+    # Patches each (method name, side effect) of side_effects on target for
+    # the rest of the test.
+    for method, side_effect in side_effects:
+      patcher = mock.patch.object(target, method, side_effect=side_effect)
+      patcher.start()
+      self.addCleanup(patcher.stop)
 
   def get_mock_response(self, status=200, content='{}'):
     mock_response = mock.Mock()
     mock_response.status_code = status
     mock_response.content = content
+    mock_response.headers = {}
+
+    def iter_content(chunk_size=1):
+      body = content if isinstance(content, bytes) else content.encode("utf-8")
+      for start in range(0, len(body), chunk_size):
+        yield body[start:start + chunk_size]
 
+    mock_response.iter_content.side_effect = iter_content
     return mock_response
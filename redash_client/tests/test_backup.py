@@ -0,0 +1,139 @@
+import os
+import json
+import mock
+import shutil
+import zipfile
+import tempfile
+
+from redash_client.tests.base import AppTest
+from redash_client.client import RedashClient
+from redash_client.backup import DashboardArchiver
+from redash_client.results import SpilledRows
+from redash_client.constants import RefreshMode
+
+QUERIES = {
+    1: {"id": 1, "name": "Daily users", "query": "SELECT 1",
+        "data_source_id": 5, "description": None, "options": {},
+        "latest_query_data_id": 100, "visualizations": [
+            {"id": 11, "type": "TABLE", "name": "Table", "options": {}},
+            {"id": 12, "type": "CHART", "name": "Chart",
+             "options": {"globalSeriesType": "line"}},
+        ]},
+    2: {"id": 2, "name": "Retention", "query": "SELECT 2",
+        "data_source_id": 5, "description": "weekly",
+        "options": {"parameters": [{"name": "week"}]},
+        "latest_query_data_id": None, "visualizations": [
+            {"id": 21, "type": "TABLE", "name": "Table", "options": {}},
+        ]},
+}
+
+DASHBOARD = {"name": "Experiment", "slug": "experiment", "is_draft": False,
+             "widgets": [
+                 {"id": 1, "width": 1, "options": {"position": {"col": 0}},
+                  "visualization": {"id": 12, "query": {"id": 1}}},
+                 {"id": 2, "width": 2, "options": {"position": {"col": 3}},
+                  "visualization": {"id": 21, "query": {"id": 2}}},
+                 {"id": 3, "width": 1, "options": {}, "text": "Notes",
+                  "visualization": None},
+             ]}
+
+
+class TestDashboardArchiver(AppTest):
+
+  def setUp(self):
+    self.redash = RedashClient("test_key")
+    self.temp_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.temp_dir)
+    self.path = os.path.join(self.temp_dir, "experiment.zip")
+
+    new_query_ids = {"Daily users": (101, 111), "Retention": (102, 121)}
+    self.patch_methods(self.redash, (
+        ("get_dashboard", lambda slug: DASHBOARD),
+        ("get_query", lambda query_id: QUERIES[query_id]),
+        ("get_query_result", lambda result_id: {
+            "id": result_id, "data": {"rows": [{"users": 3}]}}),
+        ("create_new_dashboard", lambda name: {
+            "dashboard_id": 9, "dashboard_slug": "restored",
+            "slug_url": None}),
+        ("create_new_query", lambda name, *args, **kwargs: (
+            new_query_ids[name])),
+        ("update_query", None),
+        ("make_new_visualization_request", lambda *args: 112),
+        ("add_visualization_to_dashboard", None),
+        ("publish_dashboard", None),
+        ("flush_refreshes", None),
+    ))
+
+    self.archiver = DashboardArchiver(self.redash)
+
+  def test_export_writes_dashboard_queries_and_results(self):
+    query_count = self.archiver.export(
+        "Experiment", self.path, include_results=True)
+
+    self.assertEqual(query_count, 2)
+    with zipfile.ZipFile(self.path) as archive:
+      self.assertEqual(sorted(archive.namelist()), [
+          "dashboard.json", "queries/1.json", "queries/2.json",
+          "results/1.json"])
+      dashboard = json.loads(archive.read("dashboard.json").decode("utf-8"))
+      result = json.loads(archive.read("results/1.json").decode("utf-8"))
+
+    self.assertEqual(
+        [widget["query_id"] for widget in dashboard["widgets"]], [1, 2, None])
+    self.assertEqual(dashboard["widgets"][2]["text"], "Notes")
+    self.assertEqual(result["data"]["rows"], [{"users": 3}])
+    self.redash.get_query_result.assert_called_once_with(100)
+
+  def test_export_streams_spilled_results(self):
+    rows = SpilledRows([{"users": 3}, {"users": 4}], {"bytes": 30})
+    self.redash.get_query_result.side_effect = lambda result_id: {
+        "id": result_id, "data": {"columns": [], "rows": rows}}
+
+    self.archiver.export("Experiment", self.path, include_results=True)
+
+    with zipfile.ZipFile(self.path) as archive:
+      result = json.loads(archive.read("results/1.json").decode("utf-8"))
+    self.assertEqual(result, {"id": 100, "data": {
+        "columns": [], "rows": [{"users": 3}, {"users": 4}]}})
+    self.assertRaises(ValueError, list, rows)
+
+  def test_export_skips_results_by_default(self):
+    self.archiver.export("Experiment", self.path)
+
+    with zipfile.ZipFile(self.path) as archive:
+      self.assertFalse("results/1.json" in archive.namelist())
+    self.assertEqual(self.redash.get_query_result.call_count, 0)
+
+  def test_restore_recreates_dashboard(self):
+    self.archiver.export("Experiment", self.path)
+    self.redash.get_dashboard.side_effect = RedashClient.RedashClientException(
+        "Error status returned", 404)
+
+    dash_info = self.archiver.restore(self.path, name="Restored")
+
+    self.assertEqual(dash_info["dashboard_id"], 9)
+    self.redash.create_new_dashboard.assert_called_once_with("Restored")
+    for call in self.redash.create_new_query.call_args_list:
+      self.assertEqual(call[1]["refresh"], RefreshMode.DEFERRED)
+    # Only queries with options need updating after they're created.
+    self.assertEqual(self.redash.update_query.call_count, 1)
+    self.assertEqual(self.redash.update_query.call_args[0][0], 102)
+    # The default tables are reused, only the chart is created.
+    self.redash.make_new_visualization_request.assert_called_once_with(
+        101, "CHART", {"globalSeriesType": "line"}, "Chart")
+
+    self.assertCountEqual(
+        self.redash.add_visualization_to_dashboard.call_args_list, [
+            mock.call(9, 112, 1, {"position": {"col": 0}}, ""),
+            mock.call(9, 121, 2, {"position": {"col": 3}}, ""),
+            mock.call(9, None, 1, {}, "Notes"),
+        ])
+    self.redash.publish_dashboard.assert_called_once_with(9)
+    self.redash.flush_refreshes.assert_called_once_with()
+
+  def test_restore_refuses_dashboard_with_widgets(self):
+    self.archiver.export("Experiment", self.path)
+
+    self.assertRaises(
+        RedashClient.RedashClientException, self.archiver.restore, self.path)
+    self.assertEqual(self.redash.create_new_query.call_count, 0)
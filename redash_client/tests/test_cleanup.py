@@ -0,0 +1,83 @@
+import datetime
+
+from redash_client.tests.base import AppTest
+from redash_client.client import RedashClient
+from redash_client.cleanup import GarbageCollector
+
+
+class TestGarbageCollector(AppTest):
+
+  def setUp(self):
+    self.redash = RedashClient("test_key")
+    recent = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
+    queries = [
+        {"id": 1, "name": "exp: old", "tags": ["experiment"],
+         "updated_at": "2017-01-01T00:00:00.123+00:00"},
+        {"id": 2, "name": "exp: shown", "tags": [],
+         "updated_at": "2017-01-01T00:00:00"},
+        {"id": 3, "name": "exp: recent", "tags": ["experiment"],
+         "updated_at": recent},
+        {"id": 4, "name": "Keep me", "tags": ["experiment"],
+         "updated_at": "2017-01-01T00:00:00"},
+    ]
+    dashboards = {
+        "exp-dash": {"widgets": [
+            {"id": 10, "visualization": {"query": {"id": 2}}},
+            {"id": 11, "visualization": None, "text": "Notes"},
+        ]},
+        "main": {"widgets": [
+            {"id": 12, "visualization": {"query": {"id": 4}}},
+        ]},
+    }
+
+    def get_page(items):
+      def get_items(page, page_size):
+        start = (page - 1) * page_size
+        return {"count": len(items), "results": items[start:start + page_size]}
+      return get_items
+
+    self.patch_methods(self.redash, (
+        ("get_queries", get_page(queries)),
+        ("get_dashboards", get_page(
+            [{"slug": slug} for slug in sorted(dashboards)])),
+        ("get_dashboard", lambda slug: dashboards[slug]),
+        ("delete_query", None),
+        ("remove_visualization", None),
+    ))
+
+    self.collector = GarbageCollector(self.redash)
+    self.collector.PAGE_SIZE = 2
+
+  def test_plan_by_prefix_includes_widgets(self):
+    plan = self.collector.plan(name_prefix="exp:")
+
+    self.assertEqual([query["id"] for query in plan.queries], [1, 2, 3])
+    self.assertEqual(
+        plan.widgets, [{"id": 10, "dashboard": "exp-dash", "query_id": 2}])
+    self.assertTrue("Delete widget 10 on dashboard exp-dash" in
+                    plan.describe())
+    self.assertEqual(self.redash.delete_query.call_count, 0)
+
+  def test_plan_combines_criteria(self):
+    plan = self.collector.plan(
+        tags=["experiment"], older_than=datetime.timedelta(days=30),
+        unused_only=True)
+
+    self.assertEqual([query["id"] for query in plan.queries], [1])
+    self.assertEqual(plan.widgets, [])
+
+  def test_plan_requires_criteria(self):
+    self.assertRaises(ValueError, self.collector.plan)
+
+  def test_execute_reports_errors_per_item(self):
+    def delete_query(query_id):
+      if query_id == 3:
+        raise RedashClient.RedashClientException("Error status returned", 403)
+
+    self.redash.delete_query.side_effect = delete_query
+
+    result = self.collector.execute(self.collector.plan(name_prefix="exp:"))
+
+    self.assertEqual(result.deleted_widgets, [10])
+    self.assertEqual(result.deleted_queries, [1, 2])
+    self.assertEqual(result.errors, [("query", 3, "Error status returned")])
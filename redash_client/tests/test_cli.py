@@ -0,0 +1,119 @@
+import os
+import mock
+import shutil
+import tempfile
+
+from redash_client.tests.base import AppTest
+from redash_client.client import RedashClient
+from redash_client.cli import get_output_names, get_sql_paths, main
+
+
+class TestCli(AppTest):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.directory)
+    self.output_dir = os.path.join(self.directory, "results")
+
+    for name, sql_query in (("a.sql", "SELECT a"), ("b.sql", "SELECT b")):
+      with open(os.path.join(self.directory, name), "w") as sql_file:
+        sql_file.write(sql_query)
+
+    self.redash = RedashClient("test_key")
+    patcher = mock.patch.object(
+        self.redash, "get_query_results", side_effect=self.get_query_results)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def get_query_results(self, sql_query, data_source_id):
+    if sql_query == "SELECT b":
+      raise RedashClient.RedashClientException("Error status returned", 400)
+    return [{"col1": 1, "col2": "x"}, {"col1": 2, "col2": "y"}]
+
+  def read_output(self, name):
+    with open(os.path.join(self.output_dir, name)) as output_file:
+      return output_file.read()
+
+  def test_get_sql_paths_expands_directories_and_globs(self):
+    a_path = os.path.join(self.directory, "a.sql")
+    b_path = os.path.join(self.directory, "b.sql")
+
+    self.assertEqual(get_sql_paths([self.directory]), [a_path, b_path])
+    self.assertEqual(
+        get_sql_paths([os.path.join(self.directory, "*.sql"), a_path]),
+        [a_path, b_path])
+
+  def test_main_writes_ndjson_and_reports_failures(self):
+    with mock.patch("sys.stdout"):
+      exit_code = main(
+          ["-d", "5", "-o", self.output_dir, self.directory],
+          client=self.redash)
+
+    self.assertEqual(exit_code, 1)
+    self.assertEqual(
+        self.read_output("a.ndjson").splitlines(),
+        ['{"col1": 1, "col2": "x"}', '{"col1": 2, "col2": "y"}'])
+    self.redash.get_query_results.assert_any_call("SELECT a", 5)
+
+  def test_main_reports_undecodable_files(self):
+    with open(os.path.join(self.directory, "c.sql"), "wb") as sql_file:
+      sql_file.write(b"SELECT '\xe9'")
+
+    with mock.patch("sys.stdout") as stdout:
+      exit_code = main(
+          ["-d", "5", "-o", self.output_dir, self.directory],
+          client=self.redash)
+
+    self.assertEqual(exit_code, 1)
+    self.assertTrue(os.path.exists(os.path.join(self.output_dir, "a.ndjson")))
+    output = "".join(call[0][0] for call in stdout.write.call_args_list)
+    self.assertIn("c.sql: failed", output)
+    self.assertIn("3 queries (2 failed)", output)
+
+  def test_main_writes_csv(self):
+    with mock.patch("sys.stdout"):
+      main(["-d", "5", "-f", "csv", "-o", self.output_dir,
+            os.path.join(self.directory, "a.sql")], client=self.redash)
+
+    self.assertEqual(
+        self.read_output("a.csv").splitlines(), ["col1,col2", "1,x", "2,y"])
+
+  def test_files_with_the_same_name_get_separate_outputs(self):
+    sql_paths = []
+    for directory, sql_query in (("x", "SELECT x"), ("y", "SELECT y")):
+      os.mkdir(os.path.join(self.directory, directory))
+      sql_path = os.path.join(self.directory, directory, "q.sql")
+      with open(sql_path, "w") as sql_file:
+        sql_file.write(sql_query)
+      sql_paths.append(sql_path)
+    self.redash.get_query_results.side_effect = (
+        lambda sql_query, data_source_id: [{"sql": sql_query}])
+
+    with mock.patch("sys.stdout"):
+      exit_code = main(
+          ["-d", "5", "-o", self.output_dir] + sql_paths, client=self.redash)
+
+    self.assertEqual(exit_code, 0)
+    self.assertEqual(self.read_output(os.path.join("x", "q.ndjson")),
+                     '{"sql": "SELECT x"}\n')
+    self.assertEqual(self.read_output(os.path.join("y", "q.ndjson")),
+                     '{"sql": "SELECT y"}\n')
+
+  def test_output_names_keep_bare_names_in_one_directory(self):
+    a_path = os.path.join(self.directory, "a.sql")
+    b_path = os.path.join(self.directory, "b.sql")
+
+    self.assertEqual(get_output_names([a_path, b_path]),
+                     {a_path: "a", b_path: "b"})
+
+  def test_main_refuses_files_writing_the_same_output(self):
+    a_text_path = os.path.join(self.directory, "a.txt")
+    with open(a_text_path, "w") as sql_file:
+      sql_file.write("SELECT a")
+
+    with mock.patch("sys.stderr"):
+      self.assertRaises(SystemExit, main, [
+          "-d", "5", "-o", self.output_dir,
+          os.path.join(self.directory, "a.sql"), a_text_path],
+          client=self.redash)
+    self.assertEqual(self.redash.get_query_results.call_count, 0)
@@ -0,0 +1,49 @@
+import json
+import pickle
+import unittest
+
+from redash_client.decoding import ColumnarRows, ResultDecoder, decode_result
+
+ROWS = [{"col1": 1, "col2": "a"}, {"col1": 2, "col2": "b"}]
+QUERY_RESULTS_RESPONSE = {
+    "query_result": {
+        "id": 456,
+        "data": {
+            "columns": [{"name": "col2"}, {"name": "col1"}],
+            "rows": ROWS,
+        },
+    },
+}
+
+
+class TestDecoding(unittest.TestCase):
+
+  def test_decode_result_returns_columnar_rows(self):
+    json_response = decode_result(json.dumps(QUERY_RESULTS_RESPONSE).encode())
+
+    rows = json_response["query_result"]["data"]["rows"]
+    self.assertTrue(isinstance(rows, ColumnarRows))
+    self.assertEqual(json_response["query_result"]["id"], 456)
+    self.assertEqual(rows.column_names, ["col2", "col1"])
+    self.assertEqual(rows.get_column("col1"), [1, 2])
+    self.assertEqual(len(rows), 2)
+    self.assertEqual(rows[1], ROWS[1])
+    self.assertEqual(rows[-1:], ROWS[-1:])
+    self.assertEqual(list(rows), ROWS)
+    self.assertEqual(pickle.loads(pickle.dumps(rows)), ROWS)
+
+  def test_decode_result_passes_jobs_through(self):
+    JOB_RESPONSE = {"job": {"id": "123", "status": 1}}
+    self.assertEqual(decode_result(json.dumps(JOB_RESPONSE)), JOB_RESPONSE)
+
+  def test_decode_result_without_column_list(self):
+    json_response = decode_result(json.dumps(
+        {"query_result": {"data": {"rows": ROWS}}}))
+    self.assertEqual(list(json_response["query_result"]["data"]["rows"]), ROWS)
+
+  def test_result_decoder_decodes_on_worker_processes(self):
+    with ResultDecoder(processes=2, min_bytes=0) as result_decoder:
+      json_response = result_decoder.decode(
+          json.dumps(QUERY_RESULTS_RESPONSE))
+
+    self.assertEqual(json_response["query_result"]["data"]["rows"], ROWS)
@@ -0,0 +1,64 @@
+import time
+import unittest
+
+from redash_client.journal import (
+    JobJournal, JobStatus, get_query_key, normalize_query)
+
+
+class TestJobJournal(unittest.TestCase):
+
+  def setUp(self):
+    self.journal = JobJournal(":memory:")
+    self.addCleanup(self.journal.close)
+
+  def test_queries_differing_in_whitespace_share_a_key(self):
+    self.assertEqual(normalize_query("  SELECT *\n  FROM test;\n"),
+                     "SELECT * FROM test")
+    self.assertEqual(get_query_key("SELECT *  FROM test", 5),
+                     get_query_key("SELECT *\nFROM test;", 5))
+    self.assertNotEqual(get_query_key("SELECT * FROM test", 5),
+                        get_query_key("SELECT * FROM test", 6))
+
+  def test_journal_records_job_status(self):
+    self.journal.record_submitted("SELECT * FROM test", 5, "job123")
+
+    entry = self.journal.get("SELECT *\nFROM test", 5)
+    self.assertEqual(entry["job_id"], "job123")
+    self.assertEqual(entry["status"], JobStatus.PENDING)
+    self.assertEqual(entry["query_result_id"], None)
+
+    self.journal.record_status(
+        "SELECT * FROM test", 5, JobStatus.SUCCESS, 456)
+    entry = self.journal.get("SELECT * FROM test", 5)
+    self.assertEqual(entry["status"], JobStatus.SUCCESS)
+    self.assertEqual(entry["query_result_id"], 456)
+
+    self.journal.remove("SELECT * FROM test", 5)
+    self.assertEqual(self.journal.get("SELECT * FROM test", 5), None)
+
+  def test_old_entries_are_ignored(self):
+    self.journal.record_submitted("SELECT * FROM test", 5, "job123")
+    self.journal.max_age = -1
+    time.sleep(0.001)
+    self.assertEqual(self.journal.get("SELECT * FROM test", 5), None)
+
+  def test_stalled_running_entries_are_ignored(self):
+    self.journal.record_submitted("SELECT * FROM test", 5, "job123")
+    self.journal.max_pending_age = -1
+    self.assertEqual(self.journal.get("SELECT * FROM test", 5), None)
+
+    # Starting is progress, so the started job is resumed again.
+    self.journal.record_status("SELECT * FROM test", 5, JobStatus.STARTED)
+    entry = self.journal.get("SELECT * FROM test", 5)
+    self.assertEqual(entry["status"], JobStatus.STARTED)
+
+    # Polls that find the job still started don't count as progress.
+    changed_at = entry["status_changed_at"]
+    time.sleep(0.001)
+    self.journal.record_status("SELECT * FROM test", 5, JobStatus.STARTED)
+    entry = self.journal.get("SELECT * FROM test", 5)
+    self.assertEqual(entry["status_changed_at"], changed_at)
+    self.assertTrue(entry["updated_at"] > changed_at)
+
+    self.journal.max_started_age = -1
+    self.assertEqual(self.journal.get("SELECT * FROM test", 5), None)
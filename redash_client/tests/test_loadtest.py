@@ -0,0 +1,56 @@
+from redash_client.tests.base import AppTest
+from redash_client.loadtest import (
+    FakeRedashServer, LoadTest, StepResult, format_step_result, parse_mix)
+
+
+class TestLoadTest(AppTest):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.server = FakeRedashServer(latency=0, result_rows=10)
+    cls.server.start()
+
+  @classmethod
+  def tearDownClass(cls):
+    cls.server.stop()
+
+  def test_step_runs_every_workload(self):
+    load_test = LoadTest(
+        self.server, mix=parse_mix("query_results=1,search=1,dashboard=1"),
+        seed=1)
+
+    step_result = load_test.run_step(concurrency=3, duration=0.5)
+
+    self.assertEqual(step_result.errors, [])
+    for workload in ("query_results", "search", "dashboard"):
+      self.assertTrue(step_result.latencies[workload])
+      self.assertTrue(step_result.get_percentile(50, workload) > 0)
+    self.assertTrue(step_result.connections >= step_result.operations)
+    self.assertTrue(1 <= step_result.max_open_connections)
+    self.assertTrue(step_result.throughput > 0)
+
+  def test_run_steps_through_concurrency(self):
+    load_test = LoadTest(self.server, mix=parse_mix("search"))
+
+    step_results = list(load_test.run([1, 2], duration=0.2))
+
+    self.assertEqual(
+        [step_result.concurrency for step_result in step_results], [1, 2])
+
+  def test_parse_mix(self):
+    self.assertEqual(parse_mix("query_results=6, search"),
+                     [("query_results", 6.0), ("search", 1.0)])
+    self.assertRaises(ValueError, parse_mix, "query_results=1,unknown=2")
+
+  def test_step_result_statistics(self):
+    step_result = StepResult(
+        4, 2.0, {"search": [0.1, 0.2, 0.3], "dashboard": [0.4]}, [], 0.2,
+        10, 3)
+
+    self.assertEqual(step_result.operations, 4)
+    self.assertEqual(step_result.throughput, 2.0)
+    self.assertAlmostEqual(step_result.cpu_per_operation, 0.05)
+    self.assertEqual(step_result.get_percentile(50), 0.3)
+    self.assertEqual(step_result.get_percentile(50, "search"), 0.2)
+    self.assertEqual(step_result.get_percentile(50, "query_results"), None)
+    self.assertTrue("2.0" in format_step_result(step_result))
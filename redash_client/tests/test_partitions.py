@@ -0,0 +1,41 @@
+import datetime
+import unittest
+
+from redash_client.partitions import (
+    date_partitions, key_partitions, render_sql_template)
+
+
+class TestPartitions(unittest.TestCase):
+
+  def test_render_sql_template_substitutes_parameters(self):
+    sql = render_sql_template(
+        "SELECT * FROM t WHERE d >= '{{start_date}}' AND d < '{{ end_date }}'",
+        {"start_date": "2017-01-01", "end_date": "2017-01-02"})
+    self.assertEqual(
+        sql, "SELECT * FROM t WHERE d >= '2017-01-01' AND d < '2017-01-02'")
+
+  def test_render_sql_template_throws_for_missing_parameter(self):
+    self.assertRaises(
+        KeyError, lambda: render_sql_template("SELECT {{ missing }}", {}))
+
+  def test_date_partitions_cover_range(self):
+    partitions = date_partitions(
+        datetime.date(2017, 1, 1), datetime.date(2017, 1, 8), days=3)
+    self.assertEqual(partitions, [
+        {"start_date": "2017-01-01", "end_date": "2017-01-04"},
+        {"start_date": "2017-01-04", "end_date": "2017-01-07"},
+        {"start_date": "2017-01-07", "end_date": "2017-01-08"},
+    ])
+
+  def test_key_partitions_cover_range(self):
+    partitions = key_partitions(0, 25, 10)
+    self.assertEqual(partitions, [
+        {"lower_key": 0, "upper_key": 10},
+        {"lower_key": 10, "upper_key": 20},
+        {"lower_key": 20, "upper_key": 25},
+    ])
+
+  def test_partitions_throw_for_bad_step(self):
+    self.assertRaises(ValueError, lambda: key_partitions(0, 10, 0))
+    self.assertRaises(ValueError, lambda: date_partitions(
+        datetime.date(2017, 1, 1), datetime.date(2017, 1, 2), days=0))
@@ -0,0 +1,111 @@
+import mock
+import requests
+
+from redash_client.tests.base import AppTest
+from redash_client.client import RedashClient
+from redash_client.constants import Routing
+from redash_client.pool import RedashClientPool
+from redash_client.resilience import CircuitBreaker
+
+
+class TestRedashClientPool(AppTest):
+
+  def setUp(self):
+    self.primary = RedashClient("primary_key", base_url="http://primary")
+    self.replica = RedashClient("replica_key", base_url="http://replica/")
+    self.heavy = RedashClient("heavy_key", base_url="http://heavy")
+
+    for client in (self.primary, self.replica, self.heavy):
+      for method in ("get_query_results", "delete_query"):
+        patcher = mock.patch.object(client, method, return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    self.pool = RedashClientPool(
+        self.primary, [self.replica, (self.heavy, 3)])
+
+  def connection_error(self, *args):
+    raise RedashClient.RedashClientException(
+        "Unable to communicate with redash", requests.ConnectionError())
+
+  def test_base_url_sets_api_url(self):
+    self.assertEqual(self.replica.BASE_URL, "http://replica/")
+    self.assertEqual(self.replica.API_BASE_URL, "http://replica/api/")
+    self.assertEqual(RedashClient("key").BASE_URL, RedashClient.BASE_URL)
+
+  def test_reads_go_to_replicas_and_writes_to_primary(self):
+    for routing in Routing.allowed_routings:
+      self.pool = RedashClientPool(
+          self.primary, [self.replica, (self.heavy, 3)], routing=routing)
+
+      used_clients = set(
+          self.pool.get_query_results("SELECT 1", 5) for _ in range(50))
+
+      self.assertEqual(used_clients, set([self.replica, self.heavy]))
+      self.assertEqual(self.pool.delete_query(1234), self.primary)
+      self.assertEqual(self.primary.get_query_results.call_count, 0)
+
+  def _patch_clients(self, method):
+    for client in (self.primary, self.replica, self.heavy):
+      patcher = mock.patch.object(client, method, return_value=client)
+      patcher.start()
+      self.addCleanup(patcher.stop)
+
+  def test_dashboard_reads_go_to_replicas(self):
+    for method in ("get_dashboard", "get_dashboards"):
+      self._patch_clients(method)
+
+    self.assertNotEqual(self.pool.get_dashboard("slug"), self.primary)
+    self.assertNotEqual(self.pool.get_dashboards(1, 250), self.primary)
+
+  def test_query_reads_go_to_replicas(self):
+    for method in ("get_query", "get_query_result"):
+      self._patch_clients(method)
+
+    self.assertNotEqual(self.pool.get_query(1234), self.primary)
+    self.assertNotEqual(self.pool.get_query_result(456), self.primary)
+
+  def test_least_outstanding_prefers_idle_replica(self):
+    endpoints = self.pool._endpoints
+    endpoints[2].outstanding = 3
+
+    self.assertEqual(self.pool._get_endpoint_order()[0], endpoints[1])
+
+  def test_read_fails_over_on_connection_error(self):
+    self.replica.get_query_results.side_effect = self.connection_error
+    self.heavy.get_query_results.side_effect = self.connection_error
+
+    self.assertEqual(
+        self.pool.get_query_results("SELECT 1", 5), self.primary)
+
+    # Failed replicas are tried last until their cooldown has passed.
+    order = self.pool._get_endpoint_order()
+    self.assertEqual(order[-1].client, self.primary)
+    self.assertEqual(
+        self.pool.get_outstanding_requests(),
+        {"http://primary/": 0, "http://replica/": 0, "http://heavy/": 0})
+
+  def test_read_fails_over_on_open_circuit_breaker(self):
+    self.replica.get_query_results.side_effect = (
+        RedashClient.RedashClientException(
+            "Circuit breaker is open", CircuitBreaker()))
+    self.heavy.get_query_results.side_effect = (
+        self.replica.get_query_results.side_effect)
+
+    self.assertEqual(
+        self.pool.get_query_results("SELECT 1", 5), self.primary)
+
+  def test_other_errors_are_not_retried(self):
+    self.replica.get_query_results.side_effect = (
+        RedashClient.RedashClientException("Error status returned", 400))
+    self.heavy.get_query_results.side_effect = (
+        self.replica.get_query_results.side_effect)
+
+    self.assertRaises(
+        RedashClient.RedashClientException,
+        lambda: self.pool.get_query_results("SELECT 1", 5))
+    self.assertEqual(self.primary.get_query_results.call_count, 0)
+
+  def test_pool_throws_for_unknown_routing(self):
+    self.assertRaises(
+        ValueError, lambda: RedashClientPool(self.primary, routing="meep"))
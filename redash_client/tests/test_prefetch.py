@@ -0,0 +1,119 @@
+import threading
+
+from redash_client.tests.base import AppTest
+from redash_client.client import RedashClient
+from redash_client.prefetch import DashboardPrefetcher
+
+
+class TestDashboardPrefetcher(AppTest):
+
+  def setUp(self):
+    self.redash = RedashClient("test_key")
+    self.result_ids = {1: 100, 2: 200, 3: 300}
+
+    def get_widget_from_dash(name):
+      query_ids = {"Main": [1, 2], "Other": [2, 3]}[name]
+      widgets = [{"visualization": {"query": {
+          "id": query_id, "latest_query_data_id": self.result_ids[query_id]}}}
+          for query_id in query_ids]
+      widgets.append({"visualization": None, "text": "Notes"})
+      return widgets
+
+    self.patch_methods(self.redash, (
+        ("get_widget_from_dash", get_widget_from_dash),
+        ("get_query_result", lambda result_id: {"id": result_id}),
+    ))
+
+    self.prefetcher = DashboardPrefetcher(self.redash, ["Main", "Other"])
+
+  def test_refresh_fetches_each_result_once(self):
+    self.assertEqual(self.prefetcher.refresh(), 3)
+
+    self.assertEqual(self.prefetcher.get(2), {"id": 200})
+    self.assertEqual(self.prefetcher.get(4), None)
+    self.assertEqual(self.prefetcher.get_dashboard_results("Main"),
+                     {1: {"id": 100}, 2: {"id": 200}})
+    self.assertEqual(self.redash.get_query_result.call_count, 3)
+
+  def test_refresh_only_fetches_new_results(self):
+    self.prefetcher.refresh()
+    self.result_ids[3] = 301
+
+    self.assertEqual(self.prefetcher.refresh(), 1)
+    self.assertEqual(self.prefetcher.get(3), {"id": 301})
+    self.assertEqual(self.redash.get_query_result.call_count, 4)
+
+  def test_least_recently_used_results_are_dropped(self):
+    prefetcher = DashboardPrefetcher(self.redash, ["Main"], max_entries=1)
+    prefetcher.refresh()
+
+    self.assertEqual(len(prefetcher), 1)
+    self.assertEqual(prefetcher.get(1), None)
+    self.assertEqual(prefetcher.get(2), {"id": 200})
+
+  def test_failed_fetches_are_retried_on_next_refresh(self):
+    def get_query_result(result_id):
+      if result_id == 100:
+        raise RedashClient.RedashClientException("Error status returned", 500)
+      return {"id": result_id}
+
+    self.redash.get_query_result.side_effect = get_query_result
+    self.assertEqual(self.prefetcher.refresh(), 2)
+
+    self.redash.get_query_result.side_effect = lambda result_id: {
+        "id": result_id}
+    self.assertEqual(self.prefetcher.refresh(), 1)
+    self.assertEqual(self.prefetcher.get(1), {"id": 100})
+
+  def test_start_refreshes_in_background(self):
+    refreshed = threading.Event()
+    self.redash.get_query_result.side_effect = lambda result_id: (
+        refreshed.set() or {"id": result_id})
+
+    self.prefetcher.start()
+    self.addCleanup(self.prefetcher.stop)
+
+    self.assertTrue(refreshed.wait(5))
+
+  def test_start_with_wait_warms_cache(self):
+    self.prefetcher.start(wait=True)
+    self.prefetcher.stop()
+
+    self.assertEqual(len(self.prefetcher), 3)
+    self.assertEqual(self.redash.get_query_result.call_count, 3)
+
+  def test_unreadable_dashboard_does_not_stop_refresh(self):
+    get_widget_from_dash = self.redash.get_widget_from_dash.side_effect
+
+    def get_widget_from_dash_or_fail(name):
+      if name == "Gone":
+        raise RedashClient.RedashClientException("Error status returned", 404)
+      return get_widget_from_dash(name)
+
+    self.redash.get_widget_from_dash.side_effect = get_widget_from_dash_or_fail
+    prefetcher = DashboardPrefetcher(self.redash, ["Main", "Gone"])
+    prefetcher.start(wait=True)
+    self.addCleanup(prefetcher.stop)
+
+    self.assertEqual(len(prefetcher), 2)
+    self.assertEqual(prefetcher.get_dashboard_results("Gone"), {})
+
+  def test_failed_dashboard_keeps_previous_results(self):
+    self.prefetcher.refresh()
+    self.redash.get_widget_from_dash.side_effect = (
+        RedashClient.RedashClientException("Error status returned", 503))
+
+    self.assertEqual(self.prefetcher.refresh(), 0)
+    self.assertEqual(len(self.prefetcher), 3)
+    self.assertEqual(self.prefetcher.get_dashboard_results("Other"),
+                     {2: {"id": 200}, 3: {"id": 300}})
+
+  def test_results_no_longer_shown_are_dropped(self):
+    self.prefetcher.refresh()
+    self.redash.get_widget_from_dash.side_effect = lambda name: [
+        {"visualization": {"query": {"id": 2, "latest_query_data_id": 200}}}]
+    self.prefetcher.refresh()
+
+    self.assertEqual(len(self.prefetcher), 1)
+    self.assertEqual(self.prefetcher.get(1), None)
+    self.assertEqual(self.prefetcher.get(2), {"id": 200})
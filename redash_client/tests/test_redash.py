@@ -1,21 +1,24 @@
+import os
 import mock
+import threading
 import json
+import time
 import requests
 
 from redash_client.tests.base import AppTest
 from redash_client.client import RedashClient
-from redash_client.constants import VizType, ChartType, VizWidth
+from redash_client.results import SpilledRows
+from redash_client.decoding import ColumnarRows, decode_result
+from redash_client.journal import JobJournal, JobStatus
+from redash_client.resilience import CircuitBreaker, LatencyTracker
+from redash_client.tracing import InMemoryTracer
+from redash_client.constants import (
+    VizType, ChartType, VizWidth, OversizedResult, RefreshMode)
 
 
 class TestRedashClient(AppTest):
 
   def setUp(self):
-    # Maintain python2 compatibility
-    if not hasattr(self, 'assertCountEqual'):  # pragma: no cover
-      self.assertCountEqual = self.assertItemsEqual
-    if not hasattr(self, 'assertRaisesRegex'):  # pragma: no cover
-      self.assertRaisesRegex = self.assertRaisesRegexp
-
     api_key = "test_key"
     self.redash = RedashClient(api_key)
 
@@ -37,7 +40,7 @@ class TestRedashClient(AppTest):
   def test_request_exception_thrown(self):
     ERROR_STRING = "FAIL"
 
-    def server_call_raising_exception(url, data):
+    def server_call_raising_exception(url, data, **kwargs):
       raise requests.RequestException(ERROR_STRING)
 
     self.mock_requests_post.side_effect = server_call_raising_exception
@@ -206,7 +209,7 @@ class TestRedashClient(AppTest):
 
     self.get_calls = 0
 
-    def simulate_get_calls(url):
+    def simulate_get_calls(url, **kwargs):
       if self.get_calls == 0:
         self.assertTrue("jobs" in url)
         self.assertTrue("123" in url)
@@ -477,7 +480,7 @@ class TestRedashClient(AppTest):
         ]
     }
 
-    def get_server(url):
+    def get_server(url, **kwargs):
       response = self.get_mock_response()
       response.json.return_value = {}
       if self.get_calls == 0:
@@ -566,3 +569,730 @@ class TestRedashClient(AppTest):
 
     sources = self.redash.get_data_sources()
     self.assertEqual(sources, DATA_SOURCES)
+
+  def test_partitioned_query_results_are_merged_in_order(self):
+    def post_server(url, data, **kwargs):
+      sql_query = json.loads(data)["query"]
+      rows = [{"partition": sql_query}]
+      response = self.get_mock_response(content=json.dumps(rows))
+      response.json.return_value = {
+          "query_result": {"data": {"rows": rows}}}
+      return response
+
+    self.mock_requests_post.side_effect = post_server
+
+    rows = list(self.redash.get_partitioned_query_results(
+        "SELECT * FROM test WHERE day = '{{ day }}'", 5,
+        [{"day": day} for day in range(10)], max_workers=3))
+
+    self.assertEqual(rows, [
+        {"partition": "SELECT * FROM test WHERE day = '{0}'".format(day)}
+        for day in range(10)
+    ])
+    self.assertEqual(self.mock_requests_post.call_count, 10)
+
+  def test_partitioned_query_runs_a_bounded_window_ahead(self):
+    self._mock_immediate_rows([{"col1": 1}])
+    post_response = self.mock_requests_post.return_value
+    third_submitted = threading.Event()
+
+    def post_server(url, data, **kwargs):
+      if self.mock_requests_post.call_count == 3:
+        third_submitted.set()
+      return post_response
+
+    self.mock_requests_post.side_effect = post_server
+
+    rows = self.redash.get_partitioned_query_results(
+        "SELECT 1", 5, [{}] * 10, max_workers=2)
+    next(rows)
+
+    # Two partitions ran up front and one more once the first was read.
+    self.assertTrue(third_submitted.wait(5))
+    self.assertEqual(self.mock_requests_post.call_count, 3)
+    self.assertEqual(len(list(rows)), 9)
+    self.assertEqual(self.mock_requests_post.call_count, 10)
+
+  def test_partitioned_query_is_validated_when_called(self):
+    self._mock_schema()
+
+    self.assertRaisesRegex(
+        self.redash.RedashClientException,
+        "unknown to data source 5: main_sumary",
+        lambda: self.redash.get_partitioned_query_results(
+            "SELECT * FROM main_sumary", 5, [{}], validate=True))
+    self.assertEqual(self.mock_requests_post.call_count, 0)
+
+  def test_partitioned_query_retries_failed_partition(self):
+    self.attempts = 0
+    ROWS = [{"col1": 1}]
+
+    def post_server(url, data, **kwargs):
+      self.attempts += 1
+      if self.attempts == 1:
+        return self.get_mock_response(status=503, content="FAIL")
+      response = self.get_mock_response()
+      response.json.return_value = {"query_result": {"data": {"rows": ROWS}}}
+      return response
+
+    self.mock_requests_post.side_effect = post_server
+
+    rows = list(self.redash.get_partitioned_query_results(
+        "SELECT 1", 5, [{}]))
+
+    self.assertEqual(rows, ROWS)
+    self.assertEqual(self.mock_requests_post.call_count, 2)
+
+  def test_partitioned_query_raises_after_retries(self):
+    self.mock_requests_post.return_value = self.get_mock_response(
+        status=503, content="FAIL")
+
+    self.assertRaisesRegex(
+        self.redash.RedashClientException,
+        "Partition 0 failed after 3 attempts",
+        lambda: list(self.redash.get_partitioned_query_results(
+            "SELECT 1", 5, [{}])))
+    self.assertEqual(self.mock_requests_post.call_count, 3)
+
+  def test_partitioned_query_does_not_retry_rejected_partition(self):
+    self.mock_requests_post.return_value = self.get_mock_response(
+        status=400, content="FAIL")
+
+    self.assertRaisesRegex(
+        self.redash.RedashClientException, "Partition 0 failed: ",
+        lambda: list(self.redash.get_partitioned_query_results(
+            "SELECT 1", 5, [{}])))
+    self.assertEqual(self.mock_requests_post.call_count, 1)
+
+  def test_partitioned_query_does_not_retry_failed_job(self):
+    JOB_RESPONSE = {"job": {"id": "job_id", "status": 4,
+                            "error": "syntax error at or near FORM"}}
+    post_response = self.get_mock_response(content=json.dumps(JOB_RESPONSE))
+    post_response.json.return_value = JOB_RESPONSE
+    self.mock_requests_post.return_value = post_response
+    self.mock_requests_get.return_value = post_response
+
+    self.assertRaisesRegex(
+        self.redash.RedashClientException,
+        "Partition 0 failed: syntax error at or near FORM",
+        lambda: list(self.redash.get_partitioned_query_results(
+            "SELECT 1", 5, [{}])))
+    self.assertEqual(self.mock_requests_post.call_count, 1)
+
+  def test_partitioned_query_retries_unfinished_job(self):
+    self.redash._retry_delay = .000000001
+    JOB_RESPONSE = {"job": {"id": "job_id", "status": 2}}
+    response = self.get_mock_response(content=json.dumps(JOB_RESPONSE))
+    response.json.return_value = JOB_RESPONSE
+    self.mock_requests_post.return_value = response
+    self.mock_requests_get.return_value = response
+
+    self.assertRaisesRegex(
+        self.redash.RedashClientException,
+        "Partition 0 failed after 3 attempts: query job did not finish",
+        lambda: list(self.redash.get_partitioned_query_results(
+            "SELECT 1", 5, [{}])))
+    self.assertEqual(self.mock_requests_post.call_count, 3)
+
+  def _mock_immediate_rows(self, rows):
+    QUERY_RESULTS_RESPONSE = {"query_result": {"data": {"rows": rows}}}
+    post_response = self.get_mock_response(
+        content=json.dumps(QUERY_RESULTS_RESPONSE))
+    post_response.json.return_value = QUERY_RESULTS_RESPONSE
+    self.mock_requests_post.return_value = post_response
+
+  def test_small_query_results_stay_in_memory(self):
+    EXPECTED_ROWS = [{"col1": 1}, {"col1": 2}]
+    self._mock_immediate_rows(EXPECTED_ROWS)
+    stats = []
+    self.redash = RedashClient(
+        "test_key", max_result_rows=2, result_stats_callback=stats.append)
+
+    rows = self.redash.get_query_results("SELECT * FROM test", 5)
+
+    self.assertEqual(rows, EXPECTED_ROWS)
+    self.assertEqual(stats[0]["rows"], 2)
+    self.assertFalse(stats[0]["spilled"])
+
+  def test_oversized_query_results_spill_to_disk(self):
+    EXPECTED_ROWS = [{"col1": i} for i in range(5)]
+    self._mock_immediate_rows(EXPECTED_ROWS)
+    self.redash = RedashClient("test_key", max_result_rows=2)
+
+    rows = self.redash.get_query_results("SELECT * FROM test", 5)
+
+    self.assertTrue(isinstance(rows, SpilledRows))
+    self.assertEqual(len(rows), 5)
+    self.assertEqual(list(rows), EXPECTED_ROWS)
+    self.assertTrue(rows.stats["spilled"])
+
+    path = rows.stats["path"]
+    self.assertTrue(os.path.exists(path))
+    rows.close()
+    self.assertFalse(os.path.exists(path))
+
+  def test_oversized_query_results_throw_when_requested(self):
+    self._mock_immediate_rows([{"col1": i} for i in range(5)])
+    self.redash = RedashClient(
+        "test_key", max_result_rows=2,
+        oversized_result=OversizedResult.RAISE)
+
+    self.assertRaisesRegex(
+        self.redash.RedashClientException,
+        "Query result of 5 rows .* exceeds",
+        lambda: self.redash.get_query_results("SELECT * FROM test", 5))
+
+  def test_oversized_response_bytes_throw_before_decoding(self):
+    self._mock_immediate_rows([{"col1": i} for i in range(5)])
+    self.redash = RedashClient(
+        "test_key", max_result_bytes=10,
+        oversized_result=OversizedResult.RAISE)
+
+    self.assertRaisesRegex(
+        self.redash.RedashClientException,
+        "bytes exceeds the limit of 10 bytes",
+        lambda: self.redash.get_query_results("SELECT * FROM test", 5))
+    self.assertEqual(
+        self.mock_requests_post.return_value.json.call_count, 0)
+
+  def test_oversized_response_is_spilled_while_streaming(self):
+    EXPECTED_ROWS = [{"col1": i} for i in range(50)]
+    self._mock_immediate_rows(EXPECTED_ROWS)
+    self.redash = RedashClient("test_key", max_result_bytes=100)
+
+    rows = self.redash.get_query_results("SELECT * FROM test", 5)
+
+    self.assertTrue(isinstance(rows, SpilledRows))
+    self.assertEqual(list(rows), EXPECTED_ROWS)
+    self.assertTrue(rows.stats["bytes"] > 100)
+    rows.close()
+    # The body went to disk as it was read and was never decoded whole.
+    self.assertTrue(self.mock_requests_post.call_args[1]["stream"])
+    self.assertEqual(
+        self.mock_requests_post.return_value.json.call_count, 0)
+
+  def test_oversized_content_length_throws_before_reading(self):
+    self._mock_immediate_rows([{"col1": i} for i in range(5)])
+    self.mock_requests_post.return_value.headers = {"Content-Length": "5000"}
+    self.redash = RedashClient(
+        "test_key", max_result_bytes=10,
+        oversized_result=OversizedResult.RAISE)
+
+    self.assertRaisesRegex(
+        self.redash.RedashClientException,
+        "Response of 5000 bytes exceeds the limit of 10 bytes",
+        lambda: self.redash.get_query_results("SELECT * FROM test", 5))
+    response = self.mock_requests_post.return_value
+    self.assertEqual(response.iter_content.call_count, 0)
+    self.assertEqual(response.close.call_count, 1)
+
+  def test_large_result_within_row_limit_is_returned_in_memory(self):
+    EXPECTED_ROWS = [{"col1": i} for i in range(50)]
+    self._mock_immediate_rows(EXPECTED_ROWS)
+    self.redash = RedashClient("test_key", max_result_rows=100)
+    self.redash.RESULT_MEMORY_BYTES = 100
+
+    rows = self.redash.get_query_results("SELECT * FROM test", 5)
+
+    self.assertEqual(rows, EXPECTED_ROWS)
+    self.assertFalse(isinstance(rows, SpilledRows))
+
+  def test_client_throws_for_unknown_oversized_behavior(self):
+    self.assertRaises(ValueError, lambda: RedashClient(
+        "test_key", oversized_result="meep"))
+
+  def test_create_new_query_traces_each_request(self):
+    QUERY_ID_RESPONSE = {"id": 1234}
+    VISUALIZATION_LIST_RESPONSE = {"visualizations": [{"id": 5678}]}
+
+    post_response = self.get_mock_response(
+        content=json.dumps(QUERY_ID_RESPONSE))
+    post_response.json.return_value = QUERY_ID_RESPONSE
+    self.mock_requests_post.return_value = post_response
+
+    get_response = self.get_mock_response(
+        content=json.dumps(VISUALIZATION_LIST_RESPONSE))
+    get_response.json.return_value = VISUALIZATION_LIST_RESPONSE
+    self.mock_requests_get.return_value = get_response
+
+    tracer = InMemoryTracer()
+    self.redash = RedashClient("test_key", tracer=tracer)
+    self.redash.create_new_query("Dash Name", "SELECT * FROM test", 5)
+
+    parent, = tracer.get_spans("RedashClient.create_new_query")
+    self.assertEqual(parent.attributes, {"query_id": 1234, "table_id": 5678})
+
+    children = tracer.get_children(parent)
+    self.assertCountEqual(
+        [(span.name, span.attributes["url_path"]) for span in children], [
+            ("HTTP POST", "/api/queries"),
+            ("HTTP GET", "/api/queries/1234"),
+            ("HTTP POST", "/api/queries/1234/refresh"),
+        ])
+    self.assertTrue(
+        all(span.attributes["status_code"] == 200 for span in children))
+
+  def test_query_results_trace_poll_iterations(self):
+    QUERY_RESULTS_NOT_READY_RESPONSE = {
+        "job": {"status": 1, "id": "123"}
+    }
+
+    post_response = self.get_mock_response(
+        content=json.dumps(QUERY_RESULTS_NOT_READY_RESPONSE))
+    post_response.json.return_value = QUERY_RESULTS_NOT_READY_RESPONSE
+    self.mock_requests_post.return_value = post_response
+    self.mock_requests_get.return_value = post_response
+
+    tracer = InMemoryTracer()
+    self.redash = RedashClient("test_key", tracer=tracer)
+    self.redash._retry_delay = .000000001
+    self.redash.get_query_results("SELECT * FROM test", 5)
+
+    polls = tracer.get_spans("poll_job")
+    self.assertEqual(len(polls), self.redash.MAX_RETRY_COUNT)
+    self.assertEqual(
+        [poll.attributes["attempt"] for poll in polls],
+        list(range(self.redash.MAX_RETRY_COUNT)))
+    self.assertEqual(polls[0].attributes["status"], 1)
+    self.assertEqual(len(tracer.get_children(polls[0])), 1)
+
+    parent, = tracer.get_spans("RedashClient.get_query_results")
+    self.assertTrue(all(poll.parent is parent for poll in polls))
+
+  def test_create_new_query_uses_visualizations_from_response(self):
+    QUERY_RESPONSE = {
+        "id": "query_id123",
+        "visualizations": [{"id": "viz_id123"}]
+    }
+    post_response = self.get_mock_response(content=json.dumps(QUERY_RESPONSE))
+    post_response.json.return_value = QUERY_RESPONSE
+    self.mock_requests_post.return_value = post_response
+
+    query_id, table_id = self.redash.create_new_query(
+        "Dash Name", "SELECT * FROM test", 5)
+
+    self.assertEqual(query_id, "query_id123")
+    self.assertEqual(table_id, "viz_id123")
+    self.assertEqual(self.mock_requests_post.call_count, 2)
+    self.assertEqual(self.mock_requests_get.call_count, 0)
+
+  def test_refresh_is_tracked_when_visualization_lookup_fails(self):
+    QUERY_RESPONSE = {"id": 1234}
+
+    def post_server(url, data=None, **kwargs):
+      if "refresh" in url:
+        return self.get_mock_response(status=403, content="FAIL")
+      response = self.get_mock_response(content=json.dumps(QUERY_RESPONSE))
+      response.json.return_value = QUERY_RESPONSE
+      return response
+
+    self.mock_requests_post.side_effect = post_server
+    self.mock_requests_get.return_value = self.get_mock_response(status=404)
+
+    self.assertRaisesRegex(
+        self.redash.RedashClientException, "404",
+        lambda: self.redash.create_new_query(
+            "Dash Name", "SELECT * FROM test", 5))
+
+    # The refresh sent alongside the lookup is still waited for.
+    self.assertRaisesRegex(
+        self.redash.RedashClientException, "1 of 1 query refreshes failed",
+        self.redash.flush_refreshes)
+
+  def test_deferred_refreshes_are_sent_on_flush(self):
+    QUERY_RESPONSE = {"id": "query_id123", "visualizations": []}
+    post_response = self.get_mock_response(content=json.dumps(QUERY_RESPONSE))
+    post_response.json.return_value = QUERY_RESPONSE
+    self.mock_requests_post.return_value = post_response
+
+    self.redash.create_new_query(
+        "Dash Name", "SELECT * FROM test", 5, refresh=RefreshMode.DEFERRED)
+    self.redash.update_query(
+        "query_id123", "Dash Name", "SELECT * FROM test", 5, "",
+        refresh=RefreshMode.DEFERRED)
+    self.assertEqual(self.mock_requests_post.call_count, 2)
+
+    # Both calls refresh the same query, so only one refresh is sent.
+    self.assertEqual(self.redash.flush_refreshes(), 1)
+    self.assertEqual(self.mock_requests_post.call_count, 3)
+    self.assertTrue(
+        "queries/query_id123/refresh" in
+        self.mock_requests_post.call_args[0][0])
+    self.assertEqual(self.redash.flush_refreshes(), 0)
+
+  def test_background_refresh_failures_raise_on_flush(self):
+    self.mock_requests_post.side_effect = [
+        self.get_mock_response(),
+        self.get_mock_response(status=500, content="FAIL"),
+    ]
+
+    self.redash.update_query(
+        1234, "Test", "SELECT * FROM table", 5, "",
+        refresh=RefreshMode.BACKGROUND)
+
+    self.assertRaisesRegex(
+        self.redash.RedashClientException,
+        "1 of 1 query refreshes failed",
+        self.redash.flush_refreshes)
+    self.assertEqual(self.mock_requests_post.call_count, 2)
+
+  def test_close_flushes_refreshes_and_stops_background_threads(self):
+    self.mock_requests_post.return_value = self.get_mock_response()
+
+    with self.redash as client:
+      client.update_query(
+          1234, "Test", "SELECT * FROM table", 5, "",
+          refresh=RefreshMode.DEFERRED)
+      client.update_query(
+          5678, "Test", "SELECT * FROM table", 5, "",
+          refresh=RefreshMode.BACKGROUND)
+      background_pool = client._background_pool
+
+    self.assertEqual(self.mock_requests_post.call_count, 4)
+    self.assertEqual(self.redash._background_pool, None)
+    self.assertRaises(
+        ValueError, background_pool.apply_async, len, ((),))
+
+  def test_refresh_throws_for_unknown_mode(self):
+    self.assertRaises(ValueError, lambda: self.redash.create_new_query(
+        "Dash Name", "SELECT * FROM test", 5, refresh="meep"))
+
+  def _mock_schema(self):
+    SCHEMA_RESPONSE = {"schema": [
+        {"name": "telemetry.main_summary", "columns": ["client_id"]},
+    ]}
+    get_response = self.get_mock_response(content=json.dumps(SCHEMA_RESPONSE))
+    get_response.json.return_value = SCHEMA_RESPONSE
+    self.mock_requests_get.return_value = get_response
+
+  def test_validated_query_with_unknown_table_is_not_submitted(self):
+    self._mock_schema()
+
+    self.assertRaisesRegex(
+        self.redash.RedashClientException,
+        "unknown to data source 5: main_sumary",
+        lambda: self.redash.get_query_results(
+            "SELECT * FROM main_sumary", 5, validate=True))
+    self.assertRaisesRegex(
+        self.redash.RedashClientException,
+        "unknown to data source 5: main_sumary",
+        lambda: self.redash.create_new_query(
+            "Name", "SELECT * FROM main_sumary", 5, validate=True))
+
+    self.assertEqual(self.mock_requests_post.call_count, 0)
+    # The schema is fetched once and then served from the cache.
+    self.assertEqual(self.mock_requests_get.call_count, 1)
+    self.assertTrue(
+        "data_sources/5/schema" in self.mock_requests_get.call_args[0][0])
+
+  def test_validated_query_with_known_tables_is_submitted(self):
+    self._mock_schema()
+    self._mock_immediate_rows([{"client_id": 1}])
+
+    rows = self.redash.get_query_results(
+        "SELECT * FROM main_summary", 5, validate=True)
+
+    self.assertEqual(rows, [{"client_id": 1}])
+    self.assertEqual(self.mock_requests_post.call_count, 1)
+
+  def test_queries_are_not_validated_without_a_schema(self):
+    SCHEMA_RESPONSES = (
+        {"job": {"id": "abc", "status": 1}},
+        {"error": {"code": 1, "message": "Not supported"}},
+    )
+    for schema_response in SCHEMA_RESPONSES:
+      get_response = self.get_mock_response(
+          content=json.dumps(schema_response))
+      get_response.json.return_value = schema_response
+      self.mock_requests_get.return_value = get_response
+      self._mock_immediate_rows([{"client_id": 1}])
+
+      rows = self.redash.get_query_results(
+          "SELECT * FROM main_summary", 5, validate=True)
+
+      self.assertEqual(rows, [{"client_id": 1}])
+
+    # The pending schema is fetched again, the unsupported one is cached.
+    self.assertFalse(self.redash.get_schema_index(5).is_available)
+    self.assertEqual(self.mock_requests_get.call_count, 2)
+
+  def test_schema_index_is_refetched_when_expired(self):
+    self._mock_schema()
+
+    self.redash.get_schema_index(5)
+    self.redash.SCHEMA_TTL = -1
+    self.redash.get_schema_index(5)
+    self.assertEqual(self.mock_requests_get.call_count, 2)
+
+  def _mock_job_server(self, job_status):
+    QUERY_RESULTS_RESPONSE = {"query_result": {"data": {"rows": [{"a": 1}]}}}
+    JOB_RESPONSE = {"job": {"status": 1, "id": "job123"}}
+
+    post_response = self.get_mock_response(content=json.dumps(JOB_RESPONSE))
+    post_response.json.return_value = JOB_RESPONSE
+    self.mock_requests_post.return_value = post_response
+
+    def get_server(url, **kwargs):
+      if "jobs/job123" in url:
+        response = {"job": {
+            "status": job_status[0], "id": "job123", "query_result_id": 456}}
+      else:
+        self.assertTrue("query_results/456" in url)
+        response = QUERY_RESULTS_RESPONSE
+      get_response = self.get_mock_response(content=json.dumps(response))
+      get_response.json.return_value = response
+      return get_response
+
+    self.mock_requests_get.side_effect = get_server
+
+  def test_journaled_job_is_resumed_instead_of_resubmitted(self):
+    job_status = [JobStatus.STARTED]
+    self._mock_job_server(job_status)
+    journal = JobJournal(":memory:")
+    self.addCleanup(journal.close)
+
+    # The first run gives up polling while the job is still running.
+    self.redash = RedashClient("test_key", journal=journal)
+    self.redash._retry_delay = .000000001
+    self.assertEqual(self.redash.get_query_results("SELECT 1", 5), [])
+    self.assertEqual(journal.get("SELECT 1", 5)["status"], JobStatus.STARTED)
+
+    # The next run polls the same job rather than posting the query again.
+    job_status[0] = JobStatus.SUCCESS
+    self.redash = RedashClient("test_key", journal=journal)
+    self.assertEqual(
+        self.redash.get_query_results("SELECT 1", 5), [{"a": 1}])
+    self.assertEqual(self.mock_requests_post.call_count, 1)
+    self.assertEqual(journal.get("SELECT 1", 5)["query_result_id"], 456)
+
+    # Once finished, the result is fetched without polling at all.
+    self.mock_requests_get.reset_mock()
+    self.assertEqual(
+        self.redash.get_query_results("SELECT 1", 5), [{"a": 1}])
+    self.assertEqual(self.mock_requests_get.call_count, 1)
+    self.assertEqual(self.mock_requests_post.call_count, 1)
+
+  def test_journaled_job_unknown_to_redash_is_resubmitted(self):
+    self._mock_job_server([JobStatus.SUCCESS])
+    journal = JobJournal(":memory:")
+    self.addCleanup(journal.close)
+    journal.record_submitted("SELECT 1", 5, "expired_job")
+
+    get_server = self.mock_requests_get.side_effect
+
+    def get_expired_job(url, **kwargs):
+      if "jobs/expired_job" in url:
+        return self.get_mock_response(status=404)
+      return get_server(url)
+
+    self.mock_requests_get.side_effect = get_expired_job
+    self.redash = RedashClient("test_key", journal=journal)
+
+    self.assertEqual(
+        self.redash.get_query_results("SELECT 1", 5), [{"a": 1}])
+    self.assertEqual(self.mock_requests_post.call_count, 1)
+    self.assertEqual(journal.get("SELECT 1", 5)["job_id"], "job123")
+
+  def test_stalled_journaled_job_is_resubmitted(self):
+    self._mock_job_server([JobStatus.SUCCESS])
+    journal = JobJournal(":memory:", max_pending_age=-1)
+    self.addCleanup(journal.close)
+    # Redash lost this job but keeps reporting it as pending.
+    journal.record_submitted("SELECT 1", 5, "lost_job")
+    self.redash = RedashClient("test_key", journal=journal)
+
+    self.assertEqual(
+        self.redash.get_query_results("SELECT 1", 5), [{"a": 1}])
+    self.assertEqual(self.mock_requests_post.call_count, 1)
+    polled_urls = [
+        call[0][0] for call in self.mock_requests_get.call_args_list]
+    self.assertFalse(any("lost_job" in url for url in polled_urls))
+
+  def test_get_queries_requests_page(self):
+    QUERIES_PAGE = {"count": 1, "page": 2, "page_size": 10, "results": []}
+    get_response = self.get_mock_response(content=json.dumps(QUERIES_PAGE))
+    get_response.json.return_value = QUERIES_PAGE
+    self.mock_requests_get.return_value = get_response
+
+    json_page = self.redash.get_queries(2, 10, order="-updated_at")
+
+    self.assertEqual(json_page, QUERIES_PAGE)
+    url = self.mock_requests_get.call_args[0][0]
+    self.assertTrue("page=2&page_size=10&order=-updated_at" in url)
+
+  def test_get_query_result_returns_stored_result(self):
+    QUERY_RESULT = {"query_result": {"id": 7, "data": {"rows": [{"a": 1}]}}}
+    get_response = self.get_mock_response(content=json.dumps(QUERY_RESULT))
+    get_response.json.return_value = QUERY_RESULT
+    self.mock_requests_get.return_value = get_response
+
+    query_result = self.redash.get_query_result(7)
+
+    self.assertEqual(query_result, QUERY_RESULT["query_result"])
+    url = self.mock_requests_get.call_args[0][0]
+    self.assertTrue("query_results/7?" in url)
+
+  def test_requests_are_sent_with_timeouts(self):
+    self.mock_requests_get.return_value = self.get_mock_response()
+    self.redash = RedashClient(
+        "test_key", endpoint_timeouts={"query_results": (1, 300)})
+
+    self.redash.get_data_sources()
+    self.redash._make_api_request(requests.get, "query_results/1")
+
+    timeouts = [
+        call[1]["timeout"] for call in self.mock_requests_get.call_args_list]
+    self.assertEqual(timeouts, [RedashClient.DEFAULT_TIMEOUT, (1, 300)])
+
+  def test_failed_get_is_retried(self):
+    self.redash.GET_RETRY_BACKOFF = 0
+    self.mock_requests_get.side_effect = [
+        requests.ConnectionError("FAIL"),
+        self.get_mock_response(status=503),
+        self.get_mock_response(),
+    ]
+
+    self.redash.get_data_sources()
+    self.assertEqual(self.mock_requests_get.call_count, 3)
+
+  def test_failed_post_is_not_retried(self):
+    self.mock_requests_post.side_effect = requests.ConnectionError("FAIL")
+
+    self.assertRaises(
+        self.redash.RedashClientException,
+        lambda: self.redash.publish_dashboard(1234))
+    self.assertEqual(self.mock_requests_post.call_count, 1)
+
+  def test_open_circuit_breaker_fails_fast(self):
+    self.mock_requests_post.return_value = self.get_mock_response(status=503)
+    circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    self.redash = RedashClient("test_key", circuit_breaker=circuit_breaker)
+
+    for attempt in range(3):
+      self.assertRaises(
+          self.redash.RedashClientException,
+          lambda: self.redash.publish_dashboard(1234))
+
+    self.assertEqual(circuit_breaker.state, CircuitBreaker.OPEN)
+    self.assertEqual(self.mock_requests_post.call_count, 2)
+
+  def test_slow_get_is_hedged(self):
+    self.redash = RedashClient("test_key", hedge_requests=True)
+    latency_tracker = self.redash._get_latency_tracker("/api/data_sources")
+    for attempt in range(LatencyTracker.MIN_SAMPLE_COUNT):
+      latency_tracker.record(0.001)
+
+    slow_response = self.get_mock_response()
+    slow_response.json.return_value = ["slow"]
+    fast_response = self.get_mock_response()
+    fast_response.json.return_value = ["fast"]
+    release_slow_response = threading.Event()
+
+    def get_server(url, **kwargs):
+      if self.mock_requests_get.call_count == 1:
+        release_slow_response.wait(5)
+        return slow_response
+      return fast_response
+
+    self.mock_requests_get.side_effect = get_server
+
+    self.assertEqual(self.redash.get_data_sources(), ["fast"])
+    self.assertEqual(self.mock_requests_get.call_count, 2)
+    release_slow_response.set()
+
+  def test_latency_is_tracked_per_endpoint(self):
+    self.redash = RedashClient(
+        "test_key", endpoint_timeouts={"queries/search": (1, 5)})
+
+    get_tracker = self.redash._get_latency_tracker
+    self.assertTrue(get_tracker("/api/jobs/1") is get_tracker("/api/jobs/2"))
+    self.assertFalse(
+        get_tracker("/api/jobs/1") is get_tracker("/api/query_results/1"))
+    self.assertFalse(
+        get_tracker("/api/queries/search") is get_tracker("/api/queries/1"))
+
+  def test_query_results_are_not_hedged_unless_asked(self):
+    QUERY_RESULT = {"query_result": {"id": 7, "data": {"rows": []}}}
+
+    def get_server(url, **kwargs):
+      time.sleep(0.05)
+      response = self.get_mock_response(content=json.dumps(QUERY_RESULT))
+      response.json.return_value = QUERY_RESULT
+      return response
+
+    self.mock_requests_get.side_effect = get_server
+
+    for hedge_query_results, request_count in ((False, 1), (True, 2)):
+      self.mock_requests_get.reset_mock()
+      self.redash = RedashClient(
+          "test_key", hedge_requests=True,
+          hedge_query_results=hedge_query_results)
+      latency_tracker = self.redash._get_latency_tracker(
+          "/api/query_results/7")
+      for attempt in range(LatencyTracker.MIN_SAMPLE_COUNT):
+        latency_tracker.record(0.000001)
+
+      self.redash.get_query_result(7)
+      self.assertEqual(self.mock_requests_get.call_count, request_count)
+
+  def test_make_widget_layout(self):
+    layout = self.redash.make_widget_layout([
+        VizWidth.REGULAR, VizWidth.REGULAR, VizWidth.REGULAR,
+        VizWidth.WIDE, VizWidth.REGULAR], start_row=2)
+
+    self.assertEqual(
+        [(options["position"]["col"], options["position"]["row"],
+          options["position"]["sizeX"]) for options in layout],
+        [(0, 2, 3), (3, 2, 3), (0, 10, 3), (0, 18, 6), (0, 26, 3)])
+    self.assertRaises(
+        ValueError, lambda: self.redash.make_widget_layout(["meep"]))
+
+  def test_add_visualizations_to_dashboard_places_widgets(self):
+    def post_server(url, data, **kwargs):
+      widget = json.loads(data)
+      response = self.get_mock_response()
+      response.json.return_value = {
+          "id": "widget_{0}".format(widget["visualization_id"])}
+      return response
+
+    self.mock_requests_post.side_effect = post_server
+
+    widget_ids = self.redash.add_visualizations_to_dashboard(
+        1234, [(1, VizWidth.WIDE), (2, VizWidth.REGULAR),
+               (3, VizWidth.REGULAR)])
+
+    self.assertEqual(widget_ids, ["widget_1", "widget_2", "widget_3"])
+    positions = dict(
+        (widget["visualization_id"], widget["options"]["position"])
+        for widget in [
+            json.loads(call[0][1])
+            for call in self.mock_requests_post.call_args_list])
+    self.assertEqual(positions[1]["row"], 0)
+    self.assertEqual(positions[2]["row"], 8)
+    self.assertEqual(positions[3]["col"], 3)
+    self.assertEqual(self.redash.add_visualizations_to_dashboard(1234, []), [])
+
+  def test_get_dashboards_wraps_plain_list(self):
+    DASHBOARDS = [{"slug": "dash"}]
+    get_response = self.get_mock_response(content=json.dumps(DASHBOARDS))
+    get_response.json.return_value = DASHBOARDS
+    self.mock_requests_get.return_value = get_response
+
+    json_page = self.redash.get_dashboards()
+
+    self.assertEqual(json_page, {"count": 1, "results": DASHBOARDS})
+
+  def test_query_results_use_result_decoder(self):
+    EXPECTED_ROWS = [{"col1": 1}, {"col1": 2}]
+    self._mock_immediate_rows(EXPECTED_ROWS)
+    result_decoder = mock.Mock()
+    result_decoder.decode.side_effect = decode_result
+    self.redash = RedashClient("test_key", result_decoder=result_decoder)
+
+    rows = self.redash.get_query_results("SELECT * FROM test", 5)
+
+    self.assertTrue(isinstance(rows, ColumnarRows))
+    self.assertEqual(list(rows), EXPECTED_ROWS)
+    self.assertEqual(result_decoder.decode.call_count, 1)
+    self.assertEqual(
+        self.mock_requests_post.return_value.json.call_count, 0)
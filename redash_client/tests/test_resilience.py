@@ -0,0 +1,48 @@
+import time
+import requests
+import unittest
+
+from redash_client.resilience import (
+    CircuitBreaker, LatencyTracker, is_transient_error)
+
+
+class TestResilience(unittest.TestCase):
+
+  def test_transient_errors(self):
+    self.assertTrue(is_transient_error(
+        Exception("Unable to communicate", requests.ConnectionError())))
+    self.assertTrue(is_transient_error(Exception("Error status", 503)))
+    self.assertFalse(is_transient_error(Exception("Error status", 404)))
+    self.assertFalse(is_transient_error(Exception("Unable to parse JSON")))
+
+  def test_circuit_breaker_opens_and_recovers(self):
+    circuit_breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.01)
+
+    circuit_breaker.record_failure()
+    self.assertTrue(circuit_breaker.allow_request())
+    circuit_breaker.record_failure()
+    self.assertEqual(circuit_breaker.state, CircuitBreaker.OPEN)
+    self.assertFalse(circuit_breaker.allow_request())
+
+    # After the reset timeout a single trial request is let through.
+    time.sleep(0.02)
+    self.assertTrue(circuit_breaker.allow_request())
+    self.assertFalse(circuit_breaker.allow_request())
+
+    circuit_breaker.record_failure()
+    self.assertEqual(circuit_breaker.state, CircuitBreaker.OPEN)
+    time.sleep(0.02)
+    self.assertTrue(circuit_breaker.allow_request())
+    circuit_breaker.record_success()
+    self.assertEqual(circuit_breaker.state, CircuitBreaker.CLOSED)
+    self.assertTrue(circuit_breaker.allow_request())
+
+  def test_latency_percentile_needs_enough_samples(self):
+    latency_tracker = LatencyTracker()
+    for latency in range(1, LatencyTracker.MIN_SAMPLE_COUNT):
+      latency_tracker.record(latency)
+    self.assertEqual(latency_tracker.get_percentile(95), None)
+
+    latency_tracker.record(LatencyTracker.MIN_SAMPLE_COUNT)
+    self.assertEqual(latency_tracker.get_percentile(95), 19)
+    self.assertEqual(latency_tracker.get_percentile(100), 20)
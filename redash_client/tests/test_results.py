@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import io
+import json
+import mock
+import unittest
+
+from redash_client.results import (
+    ROWS_PATH, SpilledRows, StreamedResult, write_json)
+
+ROWS = [{"day": u"2017-01-0{0}".format(i), "count": i * 1000.5,
+         "name": u"café {0}".format(i)} for i in range(1, 8)]
+QUERY_RESULTS_RESPONSE = {
+    "query_result": {
+        "id": 456,
+        "query": "SELECT \"rows\" FROM t",
+        "data": {"columns": [{"name": "day"}], "rows": ROWS},
+        "runtime": 12.25,
+    },
+}
+
+
+class TestStreamedResult(unittest.TestCase):
+
+  def _stream(self, json_response, chunk_bytes):
+    body = io.BytesIO(json.dumps(json_response, indent=1).encode("utf-8"))
+    with mock.patch("redash_client.results.READ_CHUNK_BYTES", chunk_bytes):
+      streamed_result = StreamedResult(body)
+      rows = list(streamed_result.iter_rows())
+    return rows, streamed_result.json_response
+
+  def test_rows_are_read_across_chunk_boundaries(self):
+    # Small chunks split strings, numbers and multibyte characters.
+    for chunk_bytes in (1, 3, 7, 4096):
+      rows, json_response = self._stream(QUERY_RESULTS_RESPONSE, chunk_bytes)
+
+      self.assertEqual(rows, ROWS)
+      query_result = json_response["query_result"]
+      self.assertEqual(query_result["id"], 456)
+      self.assertEqual(query_result["runtime"], 12.25)
+      self.assertEqual(query_result["data"]["rows"], [])
+      self.assertEqual(query_result["data"]["columns"], [{"name": "day"}])
+
+  def test_responses_without_rows_are_read_whole(self):
+    JOB_RESPONSE = {"job": {"id": "abc", "status": 1}}
+
+    rows, json_response = self._stream(JOB_RESPONSE, 5)
+
+    self.assertEqual(rows, [])
+    self.assertEqual(json_response, JOB_RESPONSE)
+
+  def test_truncated_result_raises(self):
+    body = json.dumps(QUERY_RESULTS_RESPONSE).encode("utf-8")[:-30]
+    streamed_result = StreamedResult(io.BytesIO(body))
+
+    self.assertRaises(ValueError, list, streamed_result.iter_rows())
+
+  def test_spilled_rows_count_streamed_rows(self):
+    streamed_result = StreamedResult(io.BytesIO(
+        json.dumps(QUERY_RESULTS_RESPONSE).encode("utf-8")))
+
+    with SpilledRows(streamed_result.iter_rows(), {"bytes": 10}) as rows:
+      self.assertEqual(len(rows), len(ROWS))
+      self.assertEqual(list(rows), ROWS)
+
+
+class TestWriteJson(unittest.TestCase):
+
+  def _write(self, json_response):
+    output_file = io.BytesIO() if str is bytes else io.StringIO()
+    write_json(json_response, output_file, ROWS_PATH)
+    return json.loads(output_file.getvalue())
+
+  def test_rows_are_written_from_any_iterable(self):
+    query_result = QUERY_RESULTS_RESPONSE["query_result"]
+    data = dict(query_result["data"], rows=iter(ROWS))
+
+    self.assertEqual(
+        self._write({"query_result": dict(query_result, data=data)}),
+        QUERY_RESULTS_RESPONSE)
+
+  def test_responses_without_rows_are_written_whole(self):
+    JOB_RESPONSE = {"job": {"id": "abc", "status": 1}}
+
+    self.assertEqual(self._write(JOB_RESPONSE), JOB_RESPONSE)
@@ -0,0 +1,74 @@
+import time
+import unittest
+
+from redash_client.schema import SchemaIndex, find_table_references
+
+
+class TestSchema(unittest.TestCase):
+
+  def test_find_table_references(self):
+    SQL = """
+      -- FROM commented_out
+      WITH recent AS (
+        SELECT client_id, EXTRACT(day FROM submission_date) AS day
+        FROM telemetry.main_summary
+        WHERE channel = 'from release'
+      )
+      SELECT * FROM recent
+      JOIN `clients_daily` c ON c.client_id = recent.client_id
+      LEFT JOIN (SELECT 1 FROM events) e ON TRUE
+      CROSS JOIN UNNEST(c.experiments)
+    """
+
+    self.assertEqual(
+        find_table_references(SQL),
+        ["telemetry.main_summary", "clients_daily", "events"])
+    self.assertEqual(
+        find_table_references(
+            "WITH foo (a, b) AS (SELECT 1, 2 FROM t) SELECT * FROM foo"),
+        ["t"])
+
+  def test_distinct_from_is_not_a_table_reference(self):
+    self.assertEqual(
+        find_table_references(
+            "SELECT * FROM t WHERE a IS DISTINCT FROM b "
+            "OR c IS NOT DISTINCT FROM d"),
+        ["t"])
+
+  def test_schema_index_lookups(self):
+    schema_index = SchemaIndex.from_schema_response({"schema": [
+        {"name": "telemetry.main_summary", "columns": ["client_id", "Day"]},
+        {"name": "events", "columns": [{"name": "event", "type": "string"}]},
+    ]})
+
+    self.assertEqual(len(schema_index), 2)
+    self.assertTrue(schema_index.has_table("TELEMETRY.main_summary"))
+    self.assertTrue(schema_index.has_table("main_summary"))
+    self.assertTrue(schema_index.has_table("other_db.events"))
+    self.assertFalse(schema_index.has_table("main_sumary"))
+    self.assertTrue(schema_index.has_column("main_summary", "day"))
+    self.assertTrue(schema_index.has_column("events", "event"))
+    self.assertFalse(schema_index.has_column("events", "client_id"))
+
+  def test_schema_index_accepts_plain_table_list(self):
+    schema_index = SchemaIndex.from_schema_response(
+        [{"name": "events", "columns": ["event"]}])
+    self.assertTrue(schema_index.has_column("events", "event"))
+
+  def test_schema_index_without_schema_is_unavailable(self):
+    error_index = SchemaIndex.from_schema_response({"error": {
+        "code": 1,
+        "message": "Data source type does not support retrieving schema"}})
+    job_index = SchemaIndex.from_schema_response(
+        {"job": {"id": "abc", "status": 1}})
+
+    self.assertFalse(error_index.is_available)
+    self.assertEqual(error_index.unavailable_reason,
+                     "Data source type does not support retrieving schema")
+    self.assertFalse(job_index.is_available)
+    self.assertTrue(SchemaIndex.from_schema_response([]).is_available)
+
+  def test_schema_index_expires(self):
+    schema_index = SchemaIndex({}, fetched_at=time.time() - 10)
+    self.assertTrue(schema_index.is_expired(5))
+    self.assertFalse(schema_index.is_expired(60))
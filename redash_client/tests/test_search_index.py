@@ -0,0 +1,93 @@
+import mock
+
+from redash_client.tests.base import AppTest
+from redash_client.client import RedashClient
+from redash_client.search_index import QueryIndex
+
+
+class TestQueryIndex(AppTest):
+
+  def setUp(self):
+    self.redash = RedashClient("test_key")
+    self.queries = [{
+        "id": 1,
+        "name": "AS Template: Retention",
+        "description": "Weekly retention",
+        "query": "SELECT * FROM retention",
+        "data_source_id": 5,
+        "updated_at": "2017-01-01T00:00:00",
+    }, {
+        "id": 2,
+        "name": "AS Template: Engagement",
+        "description": None,
+        "query": "SELECT * FROM engagement",
+        "data_source_id": 6,
+        "updated_at": "2017-01-02T00:00:00",
+    }]
+
+    get_queries_patcher = mock.patch.object(
+        self.redash, "get_queries", side_effect=self.get_queries)
+    self.mock_get_queries = get_queries_patcher.start()
+    self.addCleanup(get_queries_patcher.stop)
+
+    get_visualization_patcher = mock.patch.object(
+        self.redash, "_get_visualization",
+        return_value={"type": "CHART", "options": {}})
+    self.mock_get_visualization = get_visualization_patcher.start()
+    self.addCleanup(get_visualization_patcher.stop)
+
+    self.index = QueryIndex(self.redash)
+    self.index.PAGE_SIZE = 1
+
+  def get_queries(self, page, page_size, order=None):
+    queries = sorted(
+        self.queries, key=lambda query: query["updated_at"], reverse=True)
+    start = (page - 1) * page_size
+    return {
+        "count": len(queries),
+        "page": page,
+        "page_size": page_size,
+        "results": queries[start:start + page_size],
+    }
+
+  def test_search_by_keyword_and_field(self):
+    self.assertEqual(self.index.sync(), 2)
+    self.assertEqual(len(self.index), 2)
+
+    templates = self.index.search("as template:")
+    self.assertEqual([template["id"] for template in templates], [1, 2])
+    self.assertEqual(templates[0]["type"], "CHART")
+    self.assertEqual(templates[0]["query"], "SELECT * FROM retention")
+
+    templates = self.index.search("template retention")
+    self.assertEqual([template["id"] for template in templates], [1])
+
+    templates = self.index.search(data_source_id=6, name=u"ENGAGE")
+    self.assertEqual([template["id"] for template in templates], [2])
+
+    self.assertEqual(self.index.search("missing"), [])
+
+  def test_incremental_sync_only_fetches_changed_queries(self):
+    self.index.sync()
+    self.mock_get_queries.reset_mock()
+    self.mock_get_visualization.reset_mock()
+
+    self.queries[0].update(
+        name="AS Template: Churn", updated_at="2017-01-03T00:00:00")
+    self.assertEqual(self.index.sync(), 2)
+
+    # Stops at query 2 (updated at the last sync) without listing further.
+    self.assertEqual(self.mock_get_queries.call_count, 2)
+    self.assertEqual(self.mock_get_visualization.call_count, 2)
+    self.assertEqual(self.index.search(name="retention"), [])
+    self.assertEqual(self.index.search("churn")[0]["id"], 1)
+
+  def test_full_sync_drops_deleted_queries(self):
+    self.index.sync()
+    del self.queries[1]
+
+    self.index.sync(full=True)
+
+    self.assertEqual(len(self.index), 1)
+    self.assertEqual(self.index.get(2), None)
+    self.assertEqual(self.index.search("engagement"), [])
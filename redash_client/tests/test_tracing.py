@@ -0,0 +1,62 @@
+import unittest
+import threading
+
+from redash_client.tracing import InMemoryTracer, NullTracer, traced
+
+
+class TracedThing(object):
+
+  def __init__(self, tracer):
+    self._tracer = tracer
+
+  @traced
+  def do_thing(self):
+    with self._tracer.span("child", size=3):
+      self._tracer.set_attribute("empty", None)
+    return "done"
+
+  @traced
+  def fail(self):
+    raise ValueError("boop")
+
+
+class TestTracing(unittest.TestCase):
+
+  def test_traced_method_opens_parent_span(self):
+    tracer = InMemoryTracer()
+    thing = TracedThing(tracer)
+
+    self.assertEqual(thing.do_thing(), "done")
+
+    parent, = tracer.get_spans("RedashClient.do_thing")
+    child, = tracer.get_children(parent)
+    self.assertEqual(child.name, "child")
+    self.assertEqual(child.attributes, {"size": 3})
+    self.assertTrue(parent.duration >= child.duration)
+    self.assertEqual(parent.parent, None)
+
+  def test_failed_span_records_error(self):
+    tracer = InMemoryTracer()
+
+    self.assertRaises(ValueError, TracedThing(tracer).fail)
+
+    span, = tracer.spans
+    self.assertEqual(span.attributes["error"], "boop")
+
+  def test_null_tracer_records_nothing(self):
+    self.assertEqual(TracedThing(NullTracer()).do_thing(), "done")
+
+  def test_bound_function_keeps_parent_on_other_thread(self):
+    tracer = InMemoryTracer()
+
+    def work():
+      with tracer.span("worker"):
+        pass
+
+    with tracer.span("parent") as parent:
+      thread = threading.Thread(target=tracer.bind(work))
+      thread.start()
+      thread.join()
+
+    worker, = tracer.get_spans("worker")
+    self.assertTrue(worker.parent is parent)
@@ -0,0 +1,27 @@
+import mock
+
+from redash_client.tests.base import AppTest
+from redash_client.utils import (
+    get_all_pages, get_widget_query, map_concurrently)
+
+
+class TestUtils(AppTest):
+
+  def test_map_concurrently_keeps_order(self):
+    self.assertEqual(map_concurrently(abs, [-1, 2, -3], 2), [1, 2, 3])
+    self.assertEqual(map_concurrently(abs, [], 2), [])
+
+  def test_get_all_pages_stops_after_last_page(self):
+    get_page = mock.Mock(side_effect=lambda page, page_size: {
+        "count": 3,
+        "results": list(range(3))[(page - 1) * page_size:page * page_size],
+    })
+
+    self.assertEqual(list(get_all_pages(get_page, 2)), [0, 1, 2])
+    self.assertEqual(get_page.call_count, 2)
+
+  def test_get_widget_query(self):
+    self.assertEqual(
+        get_widget_query({"visualization": {"query": {"id": 3}}}), {"id": 3})
+    self.assertEqual(get_widget_query({"visualization": None}), None)
+    self.assertEqual(get_widget_query({"text": "Notes"}), None)
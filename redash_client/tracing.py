@@ -0,0 +1,167 @@
+import time
+import functools
+import threading
+import contextlib
+
+try:  # pragma: no cover
+  from opentelemetry import context as otel_context
+  from opentelemetry import trace as otel_trace
+except ImportError:  # pragma: no cover
+  otel_context = None
+  otel_trace = None
+
+
+def _clean_attributes(attributes):
+  # OpenTelemetry rejects None attribute values, so drop them everywhere to
+  # keep both tracers recording the same attributes.
+  return dict(
+      (key, value) for key, value in attributes.items() if value is not None)
+
+
+class Span(object):
+
+  def __init__(self, name, parent=None, attributes=None):
+    self.name = name
+    self.parent = parent
+    self.attributes = _clean_attributes(attributes or {})
+    self.start_time = time.time()
+    self.end_time = None
+
+  def set_attribute(self, key, value):
+    if value is not None:
+      self.attributes[key] = value
+
+  def end(self):
+    self.end_time = time.time()
+
+  @property
+  def duration(self):
+    if self.end_time is None:
+      return None
+    return self.end_time - self.start_time
+
+
+class NullTracer(object):
+  # The default tracer: records nothing and costs next to nothing.
+
+  @contextlib.contextmanager
+  def span(self, name, **attributes):
+    yield None
+
+  def set_attribute(self, key, value):
+    pass
+
+  def bind(self, function):
+    return function
+
+
+class InMemoryTracer(object):
+  # Keeps every finished span in self.spans, in the order they finished.
+  # Parent spans are tracked per thread, so spans opened on worker threads
+  # show up as roots of their own.
+
+  def __init__(self):
+    self.spans = []
+    self._local = threading.local()
+    self._lock = threading.Lock()
+
+  def _get_stack(self):
+    if not hasattr(self._local, "stack"):
+      self._local.stack = []
+    return self._local.stack
+
+  @contextlib.contextmanager
+  def span(self, name, **attributes):
+    stack = self._get_stack()
+    span = Span(name, stack[-1] if stack else None, attributes)
+    stack.append(span)
+    try:
+      yield span
+    except Exception as e:
+      span.set_attribute("error", str(e))
+      raise
+    finally:
+      stack.pop()
+      span.end()
+      with self._lock:
+        self.spans.append(span)
+
+  def set_attribute(self, key, value):
+    stack = self._get_stack()
+    if stack and stack[-1] is not None:
+      stack[-1].set_attribute(key, value)
+
+  def bind(self, function):
+    # Makes spans opened by function on another thread children of the span
+    # that is current here.
+    stack = self._get_stack()
+    parent = stack[-1] if stack else None
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+      stack = self._get_stack()
+      stack.append(parent)
+      try:
+        return function(*args, **kwargs)
+      finally:
+        stack.pop()
+
+    return wrapper
+
+  def get_spans(self, name):
+    return [span for span in self.spans if span.name == name]
+
+  def get_children(self, parent):
+    return [span for span in self.spans if span.parent is parent]
+
+  def clear(self):
+    with self._lock:
+      self.spans = []
+
+
+class OpenTelemetryTracer(object):
+  # Reports spans through the OpenTelemetry API, so they end up wherever the
+  # application has configured its tracer provider to export them.
+
+  def __init__(self, tracer=None):
+    if otel_trace is None:
+      raise ImportError(
+          "OpenTelemetryTracer requires the opentelemetry-api package")
+    self._tracer = tracer or otel_trace.get_tracer("redash_client")
+
+  @contextlib.contextmanager
+  def span(self, name, **attributes):
+    span = self._tracer.start_as_current_span(
+        name, attributes=_clean_attributes(attributes))
+    with span as current_span:
+      yield current_span
+
+  def set_attribute(self, key, value):
+    if value is not None:
+      otel_trace.get_current_span().set_attribute(key, value)
+
+  def bind(self, function):
+    parent_context = otel_context.get_current()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+      token = otel_context.attach(parent_context)
+      try:
+        return function(*args, **kwargs)
+      finally:
+        otel_context.detach(token)
+
+    return wrapper
+
+
+def traced(function):
+  # Wraps a RedashClient method in a parent span named after it, so the
+  # HTTP and polling spans it causes are grouped together.
+  span_name = "RedashClient.{0}".format(function.__name__)
+
+  @functools.wraps(function)
+  def wrapper(self, *args, **kwargs):
+    with self._tracer.span(span_name):
+      return function(self, *args, **kwargs)
+
+  return wrapper
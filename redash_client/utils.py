@@ -0,0 +1,38 @@
+from multiprocessing.pool import ThreadPool
+
+
+def map_concurrently(function, items, max_workers):
+  # As map(), calling function from up to max_workers threads at once.
+  if not items:
+    return []
+
+  pool = ThreadPool(min(max_workers, len(items)))
+  try:
+    return pool.map(function, items)
+  finally:
+    pool.terminate()
+
+
+def get_all_pages(get_page, page_size):
+  # Yields every result of a paginated list, e.g. get_page=client.get_queries,
+  # fetching each page only once the previous one has been consumed.
+  page = 1
+  while True:
+    json_page = get_page(page, page_size)
+    results = json_page.get("results", [])
+    for result in results:
+      yield result
+
+    if not results or page * page_size >= json_page.get("count", 0):
+      return
+    page += 1
+
+
+def get_widget_query(widget):
+  # Returns the query shown by a dashboard widget, or None for widgets
+  # without one. Text widgets don't have a visualization.
+  visualization = widget.get("visualization", None) or {}
+  query = visualization.get("query", None) or {}
+  if query.get("id", None) is None:
+    return None
+  return query
@@ -18,5 +18,10 @@ setup(
     "requests == 2.21.0",
     "python-slugify == 1.2.4",
     "urllib3 == 1.24.2"
-  ]
+  ],
+  entry_points={
+    "console_scripts": [
+      "redash-run-sql = redash_client.cli:main",
+    ],
+  }
 )